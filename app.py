@@ -1,36 +1,15 @@
 import streamlit as st
-import requests
-from PIL import Image, ImageDraw, ImageFont
-from io import BytesIO
-from bs4 import BeautifulSoup
 import datetime
-import textwrap
-import re
-import os
-from urllib.parse import urlparse
 import base64
-import time
 
-# Constants
-CANVAS_SIZE = (1080, 1200)
-IMAGE_SIZE = (1080, 700)
-LOGO_BOX_HEIGHT = 120
-LOGO_BOX_Y = 580
-PADDING = 20
-HEADLINE_WIDTH = 1040
-HEADLINE_MAX_HEIGHT = 220
-DATE_SOURCE_Y = 1050
-AD_AREA_Y = 1100
-AD_AREA_SIZE = (1080, 100)
-LOGO_MAX_SIZE = (142, 71)
-MAP_OPACITY = 0.3
-SOURCE_BOX_OPACITY = 0.7
-MAP_BOX_WIDTH = 1080
-MAP_BOX_HEIGHT = 400
-MAP_BOX_X = 0
-MAP_BOX_Y = 700
-DIVIDER_Y = 780
-DIVIDER_THICKNESS = 2
+from card_encoding import encode_image, get_profile
+from card_metrics import observe_card, start_metrics_server
+from card_profiler import profile_card
+from card_renderer import CardSpec, CardStyle, draw_card, draw_preview, extract_news_data, is_valid_url, load_custom_ad, load_custom_logo, preload_fonts, source_label
+from host_health import host_health
+from image_cache import image_cache
+from image_ingest import read_image_bytes
+from stage_timing import CARD_STAGES, trace_card
 
 # Theme Colors
 PRIMARY_ACCENT_COLOR = "#9f2d32"
@@ -42,408 +21,12 @@ TEXT_DARK = "#3c3c3c"
 BACKGROUND_LIGHT = "#F8F9FA"
 CONTENT_BG = "#FFFFFF"
 
-# Mapping of domains to source names in Bengali
-SOURCE_DOMAIN_MAPPING = {
-    "bdnews24.com": "বিডিনিউজ২৪",
-    "bangla.bdnews24.com": "বিডিনিউজ২৪",
-    "banglatribune.com": "বাংলা ট্রিবিউন",
-    "prothomalo.com": "প্রথম আলো",
-    "kalerkantho.com": "কালের কণ্ঠ",
-    "ittefaq.com.bd": "ইত্তেফাক",
-    "samakal.com": "সমকাল",
-    "dailyjanakantha.com": "জনকণ্ঠ",
-    "jugantor.com": "যুগান্তর",
-    "mzamin.com": "মানবজমিন",
-    "thedailystar.net": "দি ডেইলি স্টার",
-    "bangla.thedailystar.net": "দি ডেইলি স্টার",
-    "tbsnews.net": "দি বিজনেস স্ট্যান্ডার্ড",
-    "bbc.com": "বিবিসি বাংলা",
-    "kalbela.com": "কালবেলা",
-    "ajkerpatrika.com": "আজকের পত্রিকা",
-    "dhakapost.com": "ঢাকা পোস্ট",
-    "dainikpurbokone.net": "দৈনিক পূর্বকোণ",
-    "dainikazadi.net": "দৈনিক আজাদী",
-    "ctgpratidin.com": "চট্টগ্রাম প্রতিদিন",
-    "ekattor.tv": "একাত্তর টিভি",
-    "jamuna.tv": "যমুনা টিভি",
-    "dbcnews.tv": "ডিবিসি নিউজ",
-    "rtvonline.com": "আর টিভি",
-    "ntvbd.com": "এন টিভি",
-}
+# Download formats offered in the UI, mapped to card_encoding profiles
+DOWNLOAD_FORMATS = {"PNG": "download", "JPEG": "social", "WebP": "webp"}
 
-# Functions
-def is_valid_url(url):
-    regex = re.compile(
-        r'^(https?://)'
-        r'([a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}'
-        r'(/[^?\s]*)?'
-        r'(\?[^?\s]*)?'
-        r'(\#.*)?$'
-    )
-    return re.match(regex, url) is not None
-
-def extract_main_domain(url):
-    try:
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc
-        if domain.startswith("www."):
-            domain = domain[4:]
-        # Debug: Log the extracted domain
-        # print(f"Extracted domain: {domain}")
-        return domain
-    except Exception as e:
-        # Debug: Log the exception
-        # print(f"Error extracting domain from {url}: {str(e)}")
-        return "Unknown"
-
-def map_domain_to_source(domain):
-    # Check if the domain matches any in the mapping
-    mapped_source = SOURCE_DOMAIN_MAPPING.get(domain, domain)
-    # Debug: Log the mapping result
-    # print(f"Mapping domain '{domain}' to source '{mapped_source}'")
-    return mapped_source
-
-def extract_news_data(url):
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-    response = requests.get(url, headers=headers, timeout=10)
-    response.raise_for_status()
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    date_tag = soup.find('meta', {'property': 'article:published_time'})
-    date_str = date_tag['content'] if date_tag else None
-    pub_date = None
-    if date_str:
-        try:
-            pub_date = datetime.datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except ValueError:
-            pub_date = None
-
-    headline_tag = soup.find('meta', {'property': 'og:title'})
-    headline = headline_tag['content'] if headline_tag else 'Headline not found'
-
-    image_tag = soup.find('meta', {'property': 'og:image'})
-    image_url = image_tag['content'] if image_tag else None
-
-    source_tag = soup.find('meta', {'property': 'og:site_name'})
-    source = source_tag['content'] if source_tag else 'Source not found'
-
-    domain = extract_main_domain(url)
-    main_domain = map_domain_to_source(domain)
-    return pub_date, headline, image_url, source, main_domain
-
-def url_to_base64(image_url, max_retries=2):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)',
-        'Accept': 'image/*',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Referer': 'https://www.ittefaq.com.bd'
-    }
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(image_url, headers=headers, timeout=15, allow_redirects=True)
-            response.raise_for_status()
-            content_type = response.headers.get('Content-Type', '')
-            if not content_type.startswith('image/'):
-                raise Exception("The URL does not point to a valid image file.")
-            image_data = BytesIO(response.content)
-            image = Image.open(image_data)
-            buffered = BytesIO()
-            image.save(buffered, format="PNG")
-            return base64.b64encode(buffered.getvalue()).decode('utf-8')
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1 and (e.response is None or e.response.status_code in [429, 503]):
-                continue
-            raise Exception(f"Failed to fetch image from URL: {str(e)}.")
-    raise Exception("Failed to fetch image after maximum retries.")
-
-def process_image(image_source, is_uploaded=False, is_base64=False):
-    if is_uploaded:
-        image = Image.open(image_source)
-    elif is_base64:
-        if "," in image_source:
-            image_source = image_source.split(",")[1]
-        image_data = base64.b64decode(image_source)
-        image = Image.open(BytesIO(image_data))
-    else:
-        image_source = url_to_base64(image_source)
-        if "," in image_source:
-            image_source = image_source.split(",")[1]
-        image_data = base64.b64decode(image_source)
-        image = Image.open(BytesIO(image_data))
-
-    width, height = image.size
-    target_width, target_height = IMAGE_SIZE
-    aspect_ratio = width / height
-    target_aspect = target_width / target_height
-
-    if aspect_ratio > target_aspect:
-        new_height = target_height
-        new_width = int(new_height * aspect_ratio)
-        image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        left = (new_width - target_width) // 2
-        image = image.crop((left, 0, left + target_width, target_height))
-    else:
-        new_width = target_width
-        new_height = int(new_width / aspect_ratio)
-        image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        top = (new_height - target_height) // 2
-        image = image.crop((0, top, target_width, top + target_height))
-
-    return image
-
-def process_world_map(map_path):
-    if not os.path.exists(map_path):
-        return None
-    map_image = Image.open(map_path).convert("RGBA")
-    width, height = map_image.size
-
-    aspect_ratio = width / height
-    target_width, target_height = MAP_BOX_WIDTH, MAP_BOX_HEIGHT
-    target_aspect = target_width / target_height
-
-    new_width = target_width
-    new_height = int(new_width / aspect_ratio)
-    map_image = map_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-    if new_height > target_height:
-        top = (new_height - target_height) // 2
-        map_image = map_image.crop((0, top, target_width, top + target_height))
-    else:
-        new_map = Image.new("RGBA", (target_width, target_height), (0, 0, 0, 0))
-        y_offset = (target_height - new_height) // 2
-        new_map.paste(map_image, (0, y_offset))
-        map_image = new_map
-
-    map_data = map_image.getdata()
-    new_data = [(item[0], item[1], item[2], int(item[3] * MAP_OPACITY)) for item in map_data]
-    map_image.putdata(new_data)
-
-    return map_image
-
-def process_logo_box_bg(bg_path):
-    if not os.path.exists(bg_path):
-        return None
-    bg_image = Image.open(bg_path).convert("RGBA")
-    target_width, target_height = CANVAS_SIZE[0], LOGO_BOX_HEIGHT
-    bg_image = bg_image.resize((target_width, target_height), Image.Resampling.LANCZOS)
-
-    bg_data = bg_image.getdata()
-    new_data = [(item[0], item[1], item[2], int(item[3] * SOURCE_BOX_OPACITY)) for item in bg_data]
-    bg_image.putdata(new_data)
-
-    return bg_image
-
-def load_fonts(language="Bengali", font_size=48):
-    bangla_font_small = bangla_font_large = regular_font = None
-
-    try:
-        bangla_font_large = ImageFont.truetype("NotoSerifBengali-Bold.ttf", font_size)
-    except Exception:
-        try:
-            bangla_font_large = ImageFont.truetype("Arial Unicode MS.ttf", font_size)
-        except Exception:
-            bangla_font_large = ImageFont.load_default()
-
-    try:
-        bangla_font_small = ImageFont.truetype("NotoSerifBengali-Regular.ttf", 26)
-        regular_font = ImageFont.truetype("NotoSerifBengali-Regular.ttf", 24)
-    except Exception:
-        try:
-            bangla_font_small = ImageFont.truetype("Arial Unicode MS.ttf", 26)
-            regular_font = ImageFont.truetype("Arial Unicode MS.ttf", 24)
-        except Exception:
-            bangla_font_small = regular_font = ImageFont.load_default()
-
-    return bangla_font_small, bangla_font_large, regular_font
-
-def adjust_headline(headline, language, draw, max_width, max_height):
-    font_sizes = [72, 68, 64, 60, 56, 52, 48]
-    best_font_size = font_sizes[0]
-    best_headline_lines = []
-    best_spacing = 0
-    headline_y_start = 830
-
-    for size in font_sizes:
-        bangla_font_small, bangla_font_large, _ = load_fonts(language, size)
-        wrap_width = int(max_width / (size * 0.5))
-        headline_wrapped = textwrap.wrap(headline, width=wrap_width)
-        total_height = 0
-        headline_lines = []
-
-        if not headline_wrapped:
-            headline_wrapped = [headline]
-
-        for line in headline_wrapped:
-            bbox = bangla_font_large.getbbox(line)
-            line_width = bbox[2] - bbox[0]
-            line_height = bbox[3] - bbox[1]
-            if line_width > max_width:
-                headline_lines = []
-                break
-            headline_lines.append(line)
-            total_height += line_height
-
-        spacing = int(size * 1.2)
-        total_height += (len(headline_lines) - 1) * spacing
-
-        if total_height <= max_height and len(headline_lines) > 0:
-            best_font_size = size
-            best_headline_lines = headline_lines
-            best_spacing = spacing
-            break
-
-    if not best_headline_lines:
-        bangla_font_small, bangla_font_large, _ = load_fonts(language, font_sizes[-1])
-        wrap_width = int(max_width / (font_sizes[-1] * 0.5))
-        headline_wrapped = textwrap.wrap(headline, width=wrap_width)
-        best_headline_lines = [line for line in headline_wrapped[:3] if bangla_font_large.getbbox(line)[2] - bangla_font_large.getbbox(line)[0] <= max_width]
-        if not best_headline_lines:
-            best_headline_lines = [headline[:int(max_width / 10)].strip()]
-        best_spacing = int(font_sizes[-1] * 1.2)
-        best_font_size = font_sizes[-1]
-
-    bangla_font_small, bangla_font_large, _ = load_fonts(language, best_font_size)
-    headline_y = headline_y_start
-
-    for line in best_headline_lines:
-        bbox = bangla_font_large.getbbox(line)
-        text_width = bbox[2] - bbox[0]
-        text_x = PADDING + (HEADLINE_WIDTH - text_width) // 2
-        draw.text((text_x, headline_y), line, fill="white", font=bangla_font_large)
-        headline_y += best_spacing
-
-    return headline_y
-
-def convert_to_date(pub_date, language="Bengali"):
-    if language == "Bengali":
-        bengali_digits = str.maketrans("0123456789", "০১২৩৪৫৬৭৮৯")
-        bengali_months = {
-            "January": "জানুয়ারি", "February": "ফেব্রুয়ারি", "March": "মার্চ",
-            "April": "এপ্রিল", "May": "মে", "June": "জুন",
-            "July": "জুলাই", "August": "আগস্ট", "September": "সেপ্টেম্বর",
-            "October": "অক্টোবর", "November": "নভেম্বর", "December": "ডিসেম্বর"
-        }
-        date_str = pub_date.strftime("%d %B %Y") if pub_date else datetime.date.today().strftime("%d %B %Y")
-        day, month, year = date_str.split()
-        return f"{day.translate(bengali_digits)} {bengali_months.get(month, month)} {year.translate(bengali_digits)}"
-    else:
-        return pub_date.strftime("%d %B %Y") if pub_date else datetime.date.today().strftime("%d %B %Y")
-
-def create_photo_card(headline, image_source, pub_date, main_domain, language="Bengali"):
-    buf = BytesIO()
-    canvas = Image.new("RGB", CANVAS_SIZE, PRIMARY_COLOR)
-    draw = ImageDraw.Draw(canvas)
-    bangla_font_small, bangla_font_large, regular_font = load_fonts(language)
-
-    world_map_path = "world-map.png"
-    if os.path.exists(world_map_path):
-        world_map = process_world_map(world_map_path)
-        if world_map:
-            canvas = Image.new("RGBA", CANVAS_SIZE, PRIMARY_COLOR)
-            canvas.paste(world_map, (MAP_BOX_X, MAP_BOX_Y), world_map)
-            canvas = canvas.convert("RGB")
-            draw = ImageDraw.Draw(canvas)
-
-    if image_source:
-        try:
-            news_image = process_image(image_source, is_uploaded=(not isinstance(image_source, str)), is_base64=(isinstance(image_source, str) and (image_source.startswith("data:image") or re.match(r'^[A-Za-z0-9+/=]+$', image_source))))
-            canvas.paste(news_image, (0, 0))
-        except Exception as e:
-            draw.rectangle((0, 0, IMAGE_SIZE[0], IMAGE_SIZE[1]), fill="gray")
-            draw.text((400, 300), f"Image Error: {str(e)}", fill="white", font=regular_font)
-    else:
-        draw.rectangle((0, 0, IMAGE_SIZE[0], IMAGE_SIZE[1]), fill="gray")
-        draw.text((400, 300), "No Image Available", fill="white", font=regular_font)
-
-    secondary_rgba = tuple(int(SECONDARY_COLOR[i:i+2], 16) for i in (1, 3, 5)) + (int(255 * SOURCE_BOX_OPACITY),)
-    draw.rectangle((0, LOGO_BOX_Y, CANVAS_SIZE[0], LOGO_BOX_Y + LOGO_BOX_HEIGHT), fill=secondary_rgba)
-
-    if st.session_state.show_logo_box_overlay:
-        logo_box_bg_path = "logo-box-bg.png"
-        logo_box_bg = process_logo_box_bg(logo_box_bg_path)
-        if logo_box_bg:
-            canvas.paste(logo_box_bg, (0, LOGO_BOX_Y), logo_box_bg)
-
-    logo_path = "logo.png"
-    if os.path.exists(logo_path):
-        logo = Image.open(logo_path).convert("RGBA")
-        logo_width, logo_height = logo.size
-        aspect = logo_width / logo_height
-        if logo_width > logo_height:
-            logo_width = min(logo_width, LOGO_MAX_SIZE[0])
-            logo_height = int(logo_width / aspect)
-        else:
-            logo_height = min(logo_height, LOGO_MAX_SIZE[1])
-            logo_width = int(logo_height * aspect)
-        logo = logo.resize((logo_width, logo_height), Image.Resampling.LANCZOS)
-        logo_x = (CANVAS_SIZE[0] - logo_width) // 2
-        logo_y = LOGO_BOX_Y + (LOGO_BOX_HEIGHT // 2) - (logo_height // 2)
-        canvas.paste(logo, (logo_x, logo_y), logo)
-    else:
-        logo_x = (CANVAS_SIZE[0] - 100) // 2
-        logo_y = LOGO_BOX_Y + (LOGO_BOX_HEIGHT // 2)
-        draw.text((logo_x, logo_y), "Logo Missing", fill="red", font=regular_font)
-
-    if st.session_state.custom_logo:
-        logo_data = base64.b64decode(st.session_state.custom_logo.split(",")[1])
-        logo = Image.open(BytesIO(logo_data)).convert("RGBA")
-        logo_width, logo_height = logo.size
-        aspect = logo_width / logo_height
-        if logo_width > logo_height:
-            logo_width = min(logo_width, LOGO_MAX_SIZE[0])
-            logo_height = int(logo_width / aspect)
-        else:
-            logo_height = min(logo_height, LOGO_MAX_SIZE[1])
-            logo_width = int(logo_height * aspect)
-        logo = logo.resize((logo_width, logo_height), Image.Resampling.LANCZOS)
-        logo_x = (CANVAS_SIZE[0] - logo_width) // 2
-        logo_y = LOGO_BOX_Y + (LOGO_BOX_HEIGHT // 2) - (logo_height // 2)
-        canvas.paste(logo, (logo_x, logo_y), logo)
-
-    source_text = f"Source: {main_domain}"
-    text_bbox = draw.textbbox((0, 0), source_text, font=regular_font)
-    text_width = text_bbox[2] - text_bbox[0]
-    text_x = CANVAS_SIZE[0] - PADDING - text_width
-    draw.text((text_x, DATE_SOURCE_Y), source_text, fill=TEXT_COLOR, font=regular_font)
-
-    if "not found" in headline.lower():
-        headline = "কোন শিরোনাম পাওয়া যায়নি" if language == "Bengali" else "No Headline Found"
-    headline = headline.encode('utf-8').decode('utf-8')
-    adjust_headline(headline, language, draw, HEADLINE_WIDTH, HEADLINE_MAX_HEIGHT)
-
-    date_str = convert_to_date(pub_date, language)
-    draw.text((PADDING, DATE_SOURCE_Y), date_str, fill=TEXT_COLOR, font=bangla_font_small)
-
-    comment_text = "বিস্তারিত কমেন্টে" if language == "Bengali" else "More in comments"
-    bold_font = ImageFont.truetype("NotoSerifBengali-Bold.ttf", 31)
-    text_bbox = draw.textbbox((0, 0), comment_text, font=bold_font)
-    text_width = text_bbox[2] - text_bbox[0]
-    text_x = (CANVAS_SIZE[0] - text_width) // 2
-    draw.text((text_x, 720), comment_text, fill=SECONDARY_TEXT_COLOR, font=bold_font)
-
-    draw.rectangle((0, DIVIDER_Y, CANVAS_SIZE[0], DIVIDER_Y + DIVIDER_THICKNESS), fill=SECONDARY_COLOR)
-
-    ad_path = "cp-ad.png"
-    if os.path.exists(ad_path):
-        ad_image = Image.open(ad_path)
-        ad_image = ad_image.resize(AD_AREA_SIZE, Image.Resampling.LANCZOS)
-        canvas.paste(ad_image, (0, AD_AREA_Y))
-    else:
-        draw.rectangle((0, AD_AREA_Y, AD_AREA_SIZE[0], AD_AREA_Y + AD_AREA_SIZE[1]), fill="black")
-        draw.text((CANVAS_SIZE[0] // 2, AD_AREA_Y + 50), "Default Ad Image Missing", fill="white", font=regular_font, anchor="mm")
-
-    if st.session_state.custom_ad:
-        ad_data = base64.b64decode(st.session_state.custom_ad.split(",")[1])
-        ad_image = Image.open(BytesIO(ad_data))
-        ad_image = ad_image.resize(AD_AREA_SIZE, Image.Resampling.LANCZOS)
-        canvas.paste(ad_image, (0, AD_AREA_Y))
-
-    canvas.save(buf, format="PNG")
-    byte_im = buf.getvalue()
-
-    img_base64 = base64.b64encode(byte_im).decode('utf-8')
-    return img_base64, buf
+# Fonts are process-wide; only the first run in a process opens any files
+preload_fonts()
+start_metrics_server()
 
 # Initialize session state for colors, custom images, logo box overlay, and card counter
 if 'primary_color' not in st.session_state:
@@ -462,6 +45,10 @@ if 'custom_ad' not in st.session_state:
     st.session_state.custom_ad = None
 if 'custom_ad_name' not in st.session_state:
     st.session_state.custom_ad_name = None
+if 'custom_logo_upload_id' not in st.session_state:
+    st.session_state.custom_logo_upload_id = None
+if 'custom_ad_upload_id' not in st.session_state:
+    st.session_state.custom_ad_upload_id = None
 if 'show_logo_box_overlay' not in st.session_state:
     st.session_state.show_logo_box_overlay = True
 if 'generate_key' not in st.session_state:
@@ -478,12 +65,18 @@ if 'url_value' not in st.session_state:
     st.session_state.url_value = ""
 if 'card_counter' not in st.session_state:
     st.session_state.card_counter = 1
-
-# Use session state colors
-PRIMARY_COLOR = st.session_state.primary_color
-SECONDARY_COLOR = st.session_state.secondary_color
-TEXT_COLOR = st.session_state.text_color
-SECONDARY_TEXT_COLOR = st.session_state.secondary_text_color
+if 'download_format' not in st.session_state:
+    st.session_state.download_format = "PNG"
+if 'article' not in st.session_state:
+    st.session_state.article = None
+if 'preview' not in st.session_state:
+    st.session_state.preview = None
+if 'download' not in st.session_state:
+    st.session_state.download = None
+if 'card_trace' not in st.session_state:
+    st.session_state.card_trace = None
+if 'card_profile' not in st.session_state:
+    st.session_state.card_profile = None
 
 # Custom CSS and JavaScript
 st.markdown(
@@ -793,6 +386,9 @@ with col1:
                 st.session_state.url_value = ""
                 st.session_state.pasted_image = None
                 st.session_state.pasted_image_bridge = ""
+                st.session_state.article = None
+                st.session_state.preview = None
+                st.session_state.download = None
                 st.rerun()
 
     if not skip_url and url and not is_valid_url(url):
@@ -895,22 +491,27 @@ with col1:
             type=["png", "jpg", "jpeg"],
             key=f"custom_logo_upload_{st.session_state.generate_key}"
         )
-        if custom_logo_upload:
-            logo_bytes = custom_logo_upload.read()
-            logo_base64 = f"data:image/png;base64,{base64.b64encode(logo_bytes).decode('utf-8')}"
-            st.session_state.custom_logo = logo_base64
-            st.session_state.custom_logo_name = custom_logo_upload.name
+        # Uploads are decoded and fitted once, not on every rerun.
+        if custom_logo_upload and custom_logo_upload.file_id != st.session_state.custom_logo_upload_id:
+            st.session_state.custom_logo_upload_id = custom_logo_upload.file_id
+            try:
+                st.session_state.custom_logo = load_custom_logo(custom_logo_upload)
+                st.session_state.custom_logo_name = custom_logo_upload.name
+            except (OSError, ValueError) as e:
+                st.error(f"Could not use this logo: {e}")
 
         custom_ad_upload = st.file_uploader(
             "Upload a custom ad",
             type=["png", "jpg", "jpeg"],
             key=f"custom_ad_upload_{st.session_state.generate_key}"
         )
-        if custom_ad_upload:
-            ad_bytes = custom_ad_upload.read()
-            ad_base64 = f"data:image/png;base64,{base64.b64encode(ad_bytes).decode('utf-8')}"
-            st.session_state.custom_ad = ad_base64
-            st.session_state.custom_ad_name = custom_ad_upload.name
+        if custom_ad_upload and custom_ad_upload.file_id != st.session_state.custom_ad_upload_id:
+            st.session_state.custom_ad_upload_id = custom_ad_upload.file_id
+            try:
+                st.session_state.custom_ad = load_custom_ad(custom_ad_upload)
+                st.session_state.custom_ad_name = custom_ad_upload.name
+            except (OSError, ValueError) as e:
+                st.error(f"Could not use this ad: {e}")
 
         col1, col2 = st.columns(2)
         with col1:
@@ -952,6 +553,16 @@ with col1:
         if st.session_state.language != previous_language:
             st.session_state.headline_key += 1
 
+        st.subheader("Download Format")
+        format_options = list(DOWNLOAD_FORMATS)
+        st.session_state.download_format = st.radio(
+            "Save the card as",
+            options=format_options,
+            index=format_options.index(st.session_state.download_format),
+            horizontal=True,
+            key=f"download_format_{st.session_state.generate_key}"
+        )
+
         if st.button("Reset Customization", key="reset_customizations", type="primary"):
             st.session_state.generate_key += 1
             st.session_state.primary_color = PRIMARY_ACCENT_COLOR
@@ -962,6 +573,8 @@ with col1:
             st.session_state.custom_logo_name = None
             st.session_state.custom_ad = None
             st.session_state.custom_ad_name = None
+            st.session_state.custom_logo_upload_id = None
+            st.session_state.custom_ad_upload_id = None
             st.session_state.show_logo_box_overlay = True
             st.session_state.language = "Bengali"
             st.session_state.headline_key += 1
@@ -969,68 +582,143 @@ with col1:
             st.session_state.pasted_image_bridge = ""
             st.session_state.url_value = ""
             st.session_state.card_counter = 1
+            st.session_state.download_format = "PNG"
+            st.session_state.article = None
+            st.session_state.preview = None
+            st.session_state.download = None
             st.rerun()
 
+    def current_card_spec(article):
+        # The card as the inputs above describe it right now, on top of the
+        # article fetched by the last "Generate Card".
+        pub_date, headline, image_url, source, main_domain = article
+        if override_date:
+            pub_date = datetime.datetime.combine(manual_date, datetime.time(0, 0))
+        if override_source:
+            main_domain = manual_source
+        photo = image_source if isinstance(image_source, str) else read_image_bytes(image_source) if image_source else image_url
+        style = CardStyle(
+            primary_color=st.session_state.primary_color,
+            secondary_color=st.session_state.secondary_color,
+            text_color=st.session_state.text_color,
+            secondary_text_color=st.session_state.secondary_text_color,
+            show_logo_box_overlay=st.session_state.show_logo_box_overlay,
+            custom_logo=st.session_state.custom_logo,
+            custom_ad=st.session_state.custom_ad,
+        )
+        return CardSpec(custom_headline if custom_headline else headline, photo, pub_date, main_domain, st.session_state.language, style)
+
+    def render_preview(spec):
+        preview = encode_image(draw_preview(spec), "preview")
+        st.session_state.preview = (spec, preview)
+        return preview
+
+    # Hidden switch: ?profile=1 captures a cProfile/tracemalloc dump of the
+    # next card (see card_profiler).
+    force_profile = st.query_params.get("profile") == "1"
+    card_source = source_label(None if skip_url else url)
+
     if st.button("Generate Card", type="primary"):
         if not skip_url and not url:
             st.warning("Please provide a valid URL or check 'Skip URL'.")
         else:
             progress_bar = st.progress(0)
-            for i in range(100):
-                time.sleep(0.02)
-                progress_bar.progress(i + 1)
-            try:
-                if skip_url:
-                    pub_date = datetime.datetime(2025, 6, 3, 13, 54)
-                    headline = "Headline not found"
-                    image_url = None
-                    source = "Source not found"
-                    main_domain = "Unknown"
-                else:
-                    pub_date, headline, image_url, source, main_domain = extract_news_data(url)
-
-                if override_date:
-                    pub_date = datetime.datetime.combine(manual_date, datetime.time(0, 0))
 
-                if override_source:
-                    main_domain = manual_source
-
-                final_headline = custom_headline if custom_headline else headline
-
-                if not image_source and image_url:
-                    image_source = image_url
-
-                image_placeholder = st.empty()
-
-                img_base64, buf = create_photo_card(final_headline, image_source, pub_date, main_domain, language=st.session_state.language)
-
-                image_placeholder.markdown(
-                    f"""
-                    <div>
-                        <img src="data:image/png;base64,{img_base64}" class="base64-image" alt="Generated Card">
-                        <p class="image-caption">Generated Card ({st.session_state.language})</p>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-
-                st.download_button(
-                    "Download Card",
-                    buf,
-                    file_name="photo-card.png",
-                    mime="image/png",
-                    type="primary",
-                    key="download_button"
-                )
+            def advance_progress(trace, stage_name):
+                done = len(trace.completed() & set(CARD_STAGES))
+                progress_bar.progress(done * 100 // len(CARD_STAGES))
 
+            trace = None
+            try:
+                with trace_card(on_stage=advance_progress) as trace, profile_card("app", force_profile) as capture:
+                    if skip_url:
+                        article = (datetime.datetime(2025, 6, 3, 13, 54), "Headline not found", None, "Source not found", "Unknown")
+                    else:
+                        article = extract_news_data(url)
+                    preview = render_preview(current_card_spec(article))
+                observe_card("preview", card_source, "ok", trace.as_dict(), trace.total_ms(), preview, get_profile("preview").format.lower())
+                progress_bar.progress(100)
+                st.session_state.article = article
+                st.session_state.card_trace = trace
+                st.session_state.card_profile = capture
                 st.session_state.card_counter += 1
-                st.session_state.generate_key += 1
-                st.session_state.url_value = ""
-                st.session_state.pasted_image = None
-                st.session_state.pasted_image_bridge = ""
             except Exception as e:
+                if trace is not None:
+                    observe_card("preview", card_source, "error", trace.as_dict(), trace.total_ms())
                 st.error(f"Error generating card: {str(e)}")
                 st.session_state.generate_key += 1
                 st.session_state.url_value = ""
                 st.session_state.pasted_image = None
                 st.session_state.pasted_image_bridge = ""
+
+    # Once an article is loaded, every rerun (a new colour, headline, date,
+    # source or overlay setting) re-renders a small preview from the cached
+    # inputs. The full-size card is only drawn and encoded for download.
+    if st.session_state.article is not None:
+        spec = current_card_spec(st.session_state.article)
+        try:
+            if st.session_state.preview is None or st.session_state.preview[0] != spec:
+                with trace_card() as trace:
+                    preview = render_preview(spec)
+                observe_card("preview", card_source, "ok", trace.as_dict(), trace.total_ms(), preview, get_profile("preview").format.lower())
+                st.session_state.card_trace = trace
+                st.session_state.card_profile = None
+            preview_base64 = base64.b64encode(st.session_state.preview[1]).decode('ascii')
+            st.markdown(
+                f"""
+                <div>
+                    <img src="data:{get_profile('preview').mime};base64,{preview_base64}" class="base64-image" alt="Card Preview">
+                    <p class="image-caption">Preview ({st.session_state.language})</p>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+
+            download_profile_name = DOWNLOAD_FORMATS[st.session_state.download_format]
+            download_profile = get_profile(download_profile_name)
+            if st.button("Download Card", type="primary", key="download_button"):
+                with trace_card() as trace, profile_card("app-download", force_profile) as capture:
+                    st.session_state.download = (spec, download_profile_name, encode_image(draw_card(spec), download_profile_name))
+                observe_card("download", card_source, "ok", trace.as_dict(), trace.total_ms(), st.session_state.download[2], download_profile.format.lower())
+                st.session_state.card_trace = trace
+                st.session_state.card_profile = capture
+            download = st.session_state.download
+            if download is not None and download[0] == spec and download[1] == download_profile_name:
+                st.download_button(
+                    f"Save {st.session_state.download_format}",
+                    download[2],
+                    file_name=f"photo-card.{download_profile.extension}",
+                    mime=download_profile.mime,
+                    type="primary",
+                    key="save_button"
+                )
+        except Exception as e:
+            st.error(f"Error generating card: {str(e)}")
+
+    if st.session_state.card_trace is not None:
+        trace = st.session_state.card_trace
+        with st.expander("Stage Timings"):
+            timings = trace.as_dict()
+            st.table({"Stage": list(timings), "Milliseconds": [round(ms, 1) for ms in timings.values()]})
+            st.caption(f"Total: {trace.total_ms():.0f} ms")
+            cache_stats = image_cache.stats()
+            st.caption(
+                f"Image cache: {cache_stats['hit_rate']:.0%} hit rate, "
+                f"{cache_stats['crop_hits']} crops reused, "
+                f"{cache_stats['bytes_saved'] / 1024 / 1024:.1f} MB not downloaded"
+            )
+            # Process-wide, so failures seen by other sessions show up too.
+            failing_hosts = [row for row in host_health.snapshot() if row["state"] != "closed" or row["consecutive_failures"]]
+            if failing_hosts:
+                st.caption("Publisher hosts with recent failures")
+                st.table({
+                    "Host": [row["host"] for row in failing_hosts],
+                    "Breaker": [row["state"] for row in failing_hosts],
+                    "Failures in a row": [row["consecutive_failures"] for row in failing_hosts],
+                    "Retry in (s)": [row["retry_in"] for row in failing_hosts],
+                    "Last error": [row["last_error"] for row in failing_hosts],
+                })
+            capture = st.session_state.card_profile
+            if capture is not None and capture.path:
+                st.caption(f"Profile saved to {capture.path}")
+                st.code(capture.summary, language=None)
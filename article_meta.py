@@ -0,0 +1,166 @@
+import codecs
+import datetime
+import re
+import time
+from html.parser import HTMLParser
+from typing import NamedTuple, Optional
+
+import http_client
+from publishers import GENERIC_RULES, pick, publisher_registry
+from stage_timing import record_stage
+
+# Streaming extraction of the article <meta> tags the card needs. The page is
+# read in chunks and parsing stops at </head> (or <body>) or as soon as every
+# wanted tag has been seen; the rest of the page is never downloaded. Which
+# tags are wanted comes from the page's publisher (see publishers); unknown
+# sites get the generic og: tags.
+META_PROPERTIES = GENERIC_RULES.title + GENERIC_RULES.image + GENERIC_RULES.site_name + GENERIC_RULES.published
+CHUNK_SIZE = 16 * 1024
+MAX_HEAD_BYTES = 2 * 1024 * 1024
+
+_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([A-Za-z0-9_-]+)', re.IGNORECASE)
+
+
+class ArticleMeta(NamedTuple):
+    title: Optional[str]
+    image_url: Optional[str]
+    site_name: Optional[str]
+    published_time: Optional[str]
+    published_at: Optional[datetime.datetime]
+    bytes_read: int
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class HeadMetaParser(HTMLParser):
+    def __init__(self, rules=GENERIC_RULES):
+        super().__init__(convert_charrefs=True)
+        self.rules = rules
+        self.meta = {}
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            prop = attrs.get("property") or attrs.get("name")
+            content = attrs.get("content")
+            if prop in self.rules.properties and content is not None:
+                self.meta.setdefault(prop, content)
+                if self.rules.complete(self.meta):
+                    self.done = True
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.done = True
+
+
+def parse_published_time(value, rules=GENERIC_RULES):
+    return rules.published_at(value)
+
+
+def sniff_encoding(declared, first_chunk):
+    # Header charset wins; otherwise the page's own <meta charset>, then UTF-8.
+    # requests' ISO-8859-1 default for text/html without a charset would
+    # garble Bengali, so it is not used.
+    if declared:
+        return declared
+    match = _CHARSET_RE.search(first_chunk[:4096])
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode("ascii")).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+
+class HeadMetaReader:
+    # Push-style parsing for clients that hand over chunks from a callback.
+    def __init__(self, declared_encoding=None, rules=GENERIC_RULES):
+        self.declared_encoding = declared_encoding
+        self.parser = HeadMetaParser(rules)
+        self.decoder = None
+        self.bytes_read = 0
+        self.parse_seconds = 0.0
+
+    @property
+    def meta(self):
+        return self.parser.meta
+
+    @property
+    def done(self):
+        return self.parser.done or self.bytes_read >= MAX_HEAD_BYTES
+
+    def feed(self, chunk):
+        # Returns True once nothing more needs to be read.
+        if not chunk:
+            return self.done
+        self.bytes_read += len(chunk)
+        start = time.perf_counter()
+        if self.decoder is None:
+            encoding = sniff_encoding(self.declared_encoding, chunk)
+            self.decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self.parser.feed(self.decoder.decode(chunk))
+        self.parse_seconds += time.perf_counter() - start
+        return self.done
+
+
+def parse_article_meta(chunks, declared_encoding=None, rules=GENERIC_RULES):
+    # Returns (meta dict, bytes consumed, seconds spent parsing) for an
+    # iterable of raw byte chunks, stopping as early as possible.
+    reader = HeadMetaReader(declared_encoding, rules)
+    for chunk in chunks:
+        if reader.feed(chunk):
+            break
+    return reader.meta, reader.bytes_read, reader.parse_seconds
+
+
+def build_article_meta(meta, bytes_read, etag=None, last_modified=None, rules=GENERIC_RULES, page_url=None):
+    published_time = pick(meta, rules.published)
+    published_at = rules.published_at(published_time)
+    if published_at is not None and rules.date_format:
+        # Stored as ISO 8601, so cached entries parse without the rules.
+        published_time = published_at.isoformat()
+    return ArticleMeta(
+        title=pick(meta, rules.title),
+        image_url=rules.image_url(meta, page_url),
+        site_name=pick(meta, rules.site_name),
+        published_time=published_time,
+        published_at=published_at,
+        bytes_read=bytes_read,
+        etag=etag,
+        last_modified=last_modified,
+    )
+
+
+def declared_charset(content_type):
+    match = re.search(r'charset=["\']?([\w-]+)', content_type, re.IGNORECASE)
+    return match.group(1) if match else None
+
+
+def fetch_article_meta(url, timeout=10, etag=None, last_modified=None):
+    # With validators from an earlier fetch, returns None when the server
+    # answers 304 Not Modified.
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    rules = publisher_registry.rules_for(url)
+    start = time.perf_counter()
+    response = http_client.get(url, headers=headers, timeout=timeout, stream=True)
+    try:
+        if response.status_code == 304:
+            record_stage("fetch", time.perf_counter() - start)
+            return None
+        response.raise_for_status()
+        meta, bytes_read, parse_seconds = parse_article_meta(response.iter_content(CHUNK_SIZE), declared_charset(response.headers.get("Content-Type", "")), rules)
+    finally:
+        # Stops the download if the head was found before the end of the page.
+        response.close()
+    record_stage("fetch", time.perf_counter() - start - parse_seconds)
+    record_stage("parse", parse_seconds)
+
+    return build_article_meta(meta, bytes_read, etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"), rules=rules, page_url=url)
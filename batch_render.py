@@ -0,0 +1,188 @@
+"""Render photo cards in bulk, without the Streamlit UI.
+
+Reads a JSONL or CSV file with one card per row and renders the rows across a
+pool of worker processes. Every row needs a "url", an "image" or a "headline";
+the optional fields mirror the app's overrides:
+
+    url, headline, image, date (YYYY-MM-DD), source, language,
+    primary_color, secondary_color, text_color, secondary_text_color,
+    show_logo_box_overlay, logo, ad (paths to image files), name
+
+image is a URL, a data: URI or the path of an image file.
+
+Article pages and photos are fetched concurrently in this process and
+handed to the render workers as they arrive (see fetch_engine).
+Cards are written to the output directory, by default as PNGs
+(--profile picks another card_encoding profile, e.g. social for
+progressive JPEGs). --formats renders several card formats per row (e.g.
+feed,square,story) from a single fetch and decode, as <name>-<format>.png.
+A manifest.jsonl there gets one line per row with the outcome, the output
+file(s) and size(s) or the error, and the per-stage timings; a card whose
+photo could not be loaded is still written, with the reason as
+"image_error". A failed row, including one that is not valid JSON or not a
+valid card, does not stop the batch. With CARD_PROFILE or CARD_PROFILE_SAMPLE_RATE
+set (see card_profiler), profiled rows also get the path of their capture.
+
+    python -m batch_render cards.jsonl --out-dir cards [--workers N] [--profile NAME] [--formats LIST]
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+from card_encoding import get_profile
+from card_profiler import profile_card
+from card_renderer import CARD_FORMATS, get_card_format, preload_fonts, render_cards
+from card_spec import SpecError, card_spec, check_fields
+from fetch_engine import FetchEngine
+from stage_timing import trace_card
+
+
+class BadRow(NamedTuple):
+    # Stands in for a row that cannot be rendered; error goes to the manifest.
+    error: str
+
+
+def parse_line(line):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return BadRow(f"{type(e).__name__}: {e}")
+
+
+def check_row(row):
+    # The row itself, or a BadRow if it cannot be a card.
+    if isinstance(row, BadRow):
+        return row
+    try:
+        check_fields(row)
+    except SpecError as e:
+        return BadRow(f"{type(e).__name__}: {e}")
+    return row
+
+
+def read_rows(path):
+    # CSV cells are strings; empty ones count as missing, like absent JSON keys.
+    # Lines that are not valid JSON come back as BadRows.
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            return [{key: value for key, value in row.items() if value not in (None, "")} for row in csv.DictReader(f)]
+        return [parse_line(line) for line in f if line.strip()]
+
+
+def read_asset(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def render_row(index, row, out_dir, profile, fetched=None, formats=("feed",)):
+    # Runs in a worker process. fetched is the row's FetchedArticle when the
+    # page was fetched up front; formats are card_renderer.CARD_FORMATS names,
+    # all drawn from one decode of the photo. Returns the manifest entry for
+    # the row; any error is reported there instead of being raised.
+    result = {"row": index, "url": row.get("url")}
+    trace = capture = None
+    try:
+        with trace_card() as trace, profile_card(f"row{index}") as capture:
+            cards, image_error = render_cards(card_spec(row, read_asset, fetched), formats, profile)
+        if image_error:
+            result["image_error"] = image_error
+
+        extension = get_profile(profile).extension
+        name = row.get("name") or f"card-{index:04d}"
+        if name.lower().endswith(f".{extension}"):
+            name = name[:-len(extension) - 1]
+        outputs = {}
+        for card_format, data in cards.items():
+            # With several formats each file is named after its format.
+            outputs[card_format] = os.path.join(out_dir, f"{name}-{card_format}.{extension}" if len(cards) > 1 else f"{name}.{extension}")
+            with open(outputs[card_format], "wb") as f:
+                f.write(data)
+        if len(cards) > 1:
+            result.update(status="ok", outputs=outputs, bytes={card_format: len(data) for card_format, data in cards.items()})
+        else:
+            result.update(status="ok", output=outputs[formats[0]], bytes=len(cards[formats[0]]))
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+    if trace is not None:
+        stages = dict(fetched.stages_ms) if fetched is not None else {}
+        for name, ms in trace.as_dict().items():
+            stages[name] = stages.get(name, 0.0) + ms
+        result["stages_ms"] = {name: round(ms, 1) for name, ms in stages.items()}
+        result["total_ms"] = round(trace.total_ms(), 1)
+    if capture is not None and capture.path:
+        result["profile_dump"] = capture.path
+    return result
+
+
+async def render_all(rows, pool, workers, out_dir, profile, on_result, formats=("feed",)):
+    # Rows with a URL are fetched by the engine and rendered as they arrive;
+    # the rest go straight to the pool. Rows that are not valid cards are
+    # reported at once and never rendered.
+    loop = asyncio.get_running_loop()
+    rows = [check_row(row) for row in rows]
+    for index, row in enumerate(rows):
+        if isinstance(row, BadRow):
+            on_result({"row": index, "status": "error", "error": row.error})
+    valid = [index for index, row in enumerate(rows) if not isinstance(row, BadRow)]
+
+    async def render(index, fetched):
+        on_result(await loop.run_in_executor(pool, render_row, index, rows[index], out_dir, profile, fetched, formats))
+
+    jobs = [(index, rows[index]["url"], not rows[index].get("image")) for index in valid if rows[index].get("url")]
+    fetched_rows = {index for index, _, _ in jobs}
+    async with FetchEngine() as engine:
+        await asyncio.gather(
+            engine.run(jobs, render, consumers=workers),
+            *(render(index, None) for index in valid if index not in fetched_rows),
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL or CSV file with one card per row")
+    parser.add_argument("--out-dir", default="cards", help="where the PNGs and manifest.jsonl are written")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: one per core)")
+    parser.add_argument("--profile", default="download", help="output profile or use case from card_encoding (default: download, PNG)")
+    parser.add_argument("--formats", default="feed", help=f"comma-separated card formats: {', '.join(CARD_FORMATS)} (default: feed)")
+    args = parser.parse_args(argv)
+    formats = tuple(name.strip() for name in args.formats.split(",") if name.strip())
+    try:
+        get_profile(args.profile)
+        for card_format in formats or ("",):
+            get_card_format(card_format)
+    except ValueError as e:
+        parser.error(str(e))
+
+    rows = read_rows(args.input)
+    os.makedirs(args.out_dir, exist_ok=True)
+    manifest_path = os.path.join(args.out_dir, "manifest.jsonl")
+
+    counts = {"done": 0, "failed": 0}
+    # Manifest lines are written as rows finish, so an interrupted batch still
+    # records everything rendered so far.
+    with open(manifest_path, "w", encoding="utf-8") as manifest, ProcessPoolExecutor(max_workers=args.workers, initializer=preload_fonts) as pool:
+        def on_result(result):
+            counts["done"] += 1
+            manifest.write(json.dumps(result, ensure_ascii=False) + "\n")
+            manifest.flush()
+            if result["status"] != "ok":
+                counts["failed"] += 1
+                print(f"[{counts['done']}/{len(rows)}] row {result['row']}: {result['error']}", file=sys.stderr)
+            else:
+                print(f"[{counts['done']}/{len(rows)}] {result.get('output') or ', '.join(result['outputs'].values())}", file=sys.stderr)
+
+        asyncio.run(render_all(rows, pool, args.workers, args.out_dir, args.profile, on_result, formats))
+    failed = counts["failed"]
+
+    print(f"{len(rows) - failed} of {len(rows)} cards rendered; manifest: {manifest_path}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
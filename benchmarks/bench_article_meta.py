@@ -0,0 +1,86 @@
+"""Benchmark: streaming head-only metadata extraction against the old
+download-everything + BeautifulSoup path, over saved publisher pages served
+from a local HTTP stand-in.
+
+    python benchmarks/bench_article_meta.py [--repeat N]
+"""
+
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import http_client  # noqa: E402
+from article_meta import META_PROPERTIES, fetch_article_meta  # noqa: E402
+from http_standin import Route, StandinServer  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "html")
+
+
+def full_page_meta(url):
+    from bs4 import BeautifulSoup
+
+    response = http_client.get(url, timeout=10)
+    response.raise_for_status()
+    soup = BeautifulSoup(response.text, "html.parser")
+    meta = {}
+    for prop in META_PROPERTIES:
+        tag = soup.find("meta", {"property": prop})
+        if tag:
+            meta[prop] = tag["content"]
+    return meta, len(response.content)
+
+
+def streamed_meta(url):
+    meta = fetch_article_meta(url)
+    found = {
+        "og:title": meta.title,
+        "og:image": meta.image_url,
+        "og:site_name": meta.site_name,
+        "article:published_time": meta.published_time,
+    }
+    return {key: value for key, value in found.items() if value is not None}, meta.bytes_read
+
+
+def timed(fn, url, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(url)
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.html"))):
+        with open(path, "rb") as f:
+            pages["/" + os.path.basename(path)] = Route(f.read())
+
+    with StandinServer(pages) as server:
+        http_client.override_host("news.example", server.base_url)
+        print(f"{'page':<20}{'page KB':>9}{'full ms':>10}{'full KB':>9}{'head ms':>10}{'head KB':>9}{'speed-up':>10}")
+        for path, route in pages.items():
+            url = "https://news.example" + path
+            (full, full_bytes), full_ms = timed(full_page_meta, url, args.repeat)
+            (head, head_bytes), head_ms = timed(streamed_meta, url, args.repeat)
+            if full != head:
+                raise SystemExit(f"{path}: extracted metadata differs")
+            print(
+                f"{path[1:]:<20}{len(route.body) / 1024:>9.0f}{full_ms:>10.2f}{full_bytes / 1024:>9.0f}"
+                f"{head_ms:>10.2f}{head_bytes / 1024:>9.0f}{full_ms / head_ms:>9.1f}x"
+            )
+        http_client.clear_host_overrides()
+
+
+if __name__ == "__main__":
+    main()
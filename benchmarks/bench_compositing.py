@@ -0,0 +1,50 @@
+"""Micro-benchmark: alpha scaling via compositing.scale_alpha against the
+per-pixel getdata()/putdata() loop it replaced.
+
+    python benchmarks/bench_compositing.py [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compositing import scale_alpha  # noqa: E402
+
+CASES = [
+    ("world-map.png", (1080, 400), 0.3),
+    ("logo-box-bg.png", (1080, 120), 0.7),
+]
+
+
+def scale_alpha_loop(image, opacity):
+    image = image.copy()
+    data = image.getdata()
+    new_data = [(item[0], item[1], item[2], int(item[3] * opacity)) for item in data]
+    image.putdata(new_data)
+    return image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'image':<18}{'pixels':>10}{'loop ms':>12}{'vector ms':>12}{'speed-up':>10}")
+    for name, size, opacity in CASES:
+        image = Image.open(os.path.join(ROOT, name)).convert("RGBA").resize(size, Image.Resampling.LANCZOS)
+        if scale_alpha(image, opacity).tobytes() != scale_alpha_loop(image, opacity).tobytes():
+            raise SystemExit(f"{name}: outputs differ")
+
+        loop = min(timeit.repeat(lambda: scale_alpha_loop(image, opacity), number=1, repeat=args.repeat))
+        vector = min(timeit.repeat(lambda: scale_alpha(image, opacity), number=1, repeat=args.repeat))
+        print(f"{name:<18}{size[0] * size[1]:>10}{loop * 1000:>12.2f}{vector * 1000:>12.2f}{loop / vector:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
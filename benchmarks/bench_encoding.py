@@ -0,0 +1,64 @@
+"""Benchmark: encode time and file size of every card_encoding profile for a
+rendered photo card, plus what the app used to do (default PNG, then a
+base64 copy of it).
+
+    python benchmarks/bench_encoding.py [--photo PATH] [--repeat N]
+"""
+
+import argparse
+import base64
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from card_encoding import PROFILES, USE_CASE_PROFILES, encode_image  # noqa: E402
+from card_renderer import CardSpec, draw_card, preload_fonts  # noqa: E402
+
+HEADLINE = "ঢাকায় আজ ভারী বৃষ্টির সম্ভাবনা, আবহাওয়া অফিসের সতর্কতা জারি"
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(samples)
+
+
+def old_encode(card):
+    buf = BytesIO()
+    card.save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--photo", default=os.path.join(ROOT, "photo_card.png"))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    preload_fonts()
+    with open(args.photo, "rb") as f:
+        card = draw_card(CardSpec(HEADLINE, f.read(), None, "প্রথম আলো"))
+
+    uses = {}
+    for use_case, name in USE_CASE_PROFILES.items():
+        uses.setdefault(name, []).append(use_case)
+
+    print(f"{'profile':<18}{'ms':>9}{'KB':>9}  default for")
+    data, ms = timed(lambda: old_encode(card), args.repeat)
+    print(f"{'old png+base64':<18}{ms:>9.1f}{len(data) / 1024:>9.0f}")
+    for name in PROFILES:
+        data, ms = timed(lambda: encode_image(card, name), args.repeat)
+        print(f"{name:<18}{ms:>9.1f}{len(data) / 1024:>9.0f}  {', '.join(uses.get(name, []))}")
+
+
+if __name__ == "__main__":
+    main()
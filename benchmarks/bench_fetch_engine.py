@@ -0,0 +1,122 @@
+"""Benchmark: the asyncio fetch engine against fetching each card's article
+and photo one after the other, for a batch of URLs spread over several
+outlets. Pages and photos are served with simulated latency from a local
+HTTP stand-in. Every REDIRECT_EVERY-th URL is a tracking link that answers
+301 with the article's address, as shared links often do.
+
+    python benchmarks/bench_fetch_engine.py [--urls N] [--hosts N] [--latency MS]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import http_client  # noqa: E402
+from article_meta import fetch_article_meta  # noqa: E402
+from fetch_engine import FetchEngine  # noqa: E402
+from http_standin import Route, StandinServer  # noqa: E402
+from image_cache import image_cache  # noqa: E402
+
+REDIRECT_EVERY = 4
+
+
+def article_page(index, image_url):
+    head = (
+        f'<html><head><meta charset="utf-8"><title>{index}</title>'
+        f'<meta property="og:title" content="শিরোনাম {index}">'
+        f'<meta property="og:image" content="{image_url}">'
+        f'<meta property="og:site_name" content="Outlet">'
+        f'<meta property="article:published_time" content="2025-06-03T10:00:00Z">'
+    )
+    # Scripts and styles between og:image and </head>, as on real pages.
+    return (head + "<script>" + "var x = 1;" * 8000 + "</script></head><body>" + "<p>text</p>" * 20000 + "</body></html>").encode("utf-8")
+
+
+def photo(index):
+    buf = BytesIO()
+    Image.new("RGB", (1200, 800), (index % 256, 80, 120)).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+def sequential(urls):
+    results = {}
+    for url in urls:
+        meta = fetch_article_meta(url)
+        response = http_client.get(meta.image_url, headers={"Accept": "image/*"}, referer=http_client.referer_for(meta.image_url), timeout=15)
+        response.raise_for_status()
+        results[url] = (meta.title, response.content)
+    return results
+
+
+async def concurrent(urls, render_ms):
+    results = {}
+
+    async def consume(url, fetched):
+        if fetched.error or fetched.image_error:
+            raise SystemExit(f"{url}: {fetched.error or fetched.image_error}")
+        # Stands in for handing the pair to a render worker.
+        await asyncio.sleep(render_ms / 1000)
+        results[url] = (fetched.meta.title, fetched.image)
+
+    async with FetchEngine() as engine:
+        await engine.run(((url, url, True) for url in urls), consume, consumers=os.cpu_count())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--urls", type=int, default=120)
+    parser.add_argument("--hosts", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=60, help="server delay per response, ms")
+    parser.add_argument("--render-ms", type=float, default=0, help="simulated render time per card in the engine run")
+    args = parser.parse_args()
+
+    routes = {}
+    urls = []
+    for index in range(args.urls):
+        host = f"outlet{index % args.hosts}.example"
+        image_url = f"https://img.{host}/photos/{index}.jpg"
+        routes[f"/news/{index}"] = Route(article_page(index, image_url), delay=args.latency / 1000)
+        routes[f"/photos/{index}.jpg"] = Route(photo(index), content_type="image/jpeg", delay=args.latency / 1000)
+        if index % REDIRECT_EVERY == 0:
+            routes[f"/r/{index}"] = Route(b"", status=301, headers={"Location": f"/news/{index}"}, delay=args.latency / 1000)
+            urls.append(f"https://{host}/r/{index}")
+        else:
+            urls.append(f"https://{host}/news/{index}")
+
+    with StandinServer(routes) as server, tempfile.TemporaryDirectory() as cache_dir:
+        for index in range(args.hosts):
+            http_client.override_host(f"outlet{index}.example", server.base_url)
+            http_client.override_host(f"img.outlet{index}.example", server.base_url)
+        image_cache.directory = cache_dir
+
+        start = time.perf_counter()
+        expected = sequential(urls)
+        sequential_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = asyncio.run(concurrent(urls, args.render_ms))
+        concurrent_s = time.perf_counter() - start
+        http_client.clear_host_overrides()
+
+    if results != expected:
+        raise SystemExit("fetched metadata or photos differ")
+    print(f"{args.urls} cards over {args.hosts} hosts, {args.latency:.0f} ms per response, every {REDIRECT_EVERY}th redirected")
+    print(f"{'sequential':<12}{sequential_s:>8.2f} s")
+    print(f"{'engine':<12}{concurrent_s:>8.2f} s  ({sequential_s / concurrent_s:.1f}x)")
+    if args.render_ms:
+        # With rendering in the loop the best case is rendering alone.
+        print(f"{'render only':<12}{args.urls * args.render_ms / 1000 / os.cpu_count():>8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
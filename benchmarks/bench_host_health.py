@@ -0,0 +1,121 @@
+"""Benchmark: cards against a failing publisher, with and without the
+per-host circuit breakers and adaptive timeouts of host_health. A local HTTP
+stand-in plays an image CDN answering 503, an article host that hangs, and a
+fast host that suddenly stalls.
+
+    python benchmarks/bench_host_health.py [--cards N] [--hang S] [--timeout S]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import http_client  # noqa: E402
+from article_meta import fetch_article_meta  # noqa: E402
+from card_renderer import CardSpec, draw_card, extract_news_data, preload_fonts  # noqa: E402
+from host_health import BREAKER_FAILURES, HostUnavailable, host_health  # noqa: E402
+from http_standin import Route, StandinServer  # noqa: E402
+from image_cache import image_cache  # noqa: E402
+from meta_cache import article_cache  # noqa: E402
+
+PAGE = (
+    '<html><head><meta property="og:title" content="শিরোনাম">'
+    '<meta property="og:image" content="https://cdn.flaky.example/p.jpg">'
+    '<meta property="og:site_name" content="Flaky"></head><body></body></html>'
+).encode("utf-8")
+
+
+def timed(calls, call):
+    # Seconds per call; exceptions count as finished calls.
+    times = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        try:
+            call()
+        except Exception:
+            pass
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run(label, breaker, calls, call):
+    host_health.clear()
+    host_health.failures = BREAKER_FAILURES if breaker else 10 ** 9
+    times = timed(calls, call)
+    print(f"{label:<34}{'on' if breaker else 'off':>4}{sum(times):>9.2f} s{max(times) * 1000:>9.0f} ms{times[-1] * 1000:>9.1f} ms")
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=10)
+    parser.add_argument("--hang", type=float, default=3, help="seconds the hanging host takes to answer")
+    parser.add_argument("--timeout", type=float, default=1, help="caller timeout for the hanging article host")
+    args = parser.parse_args()
+
+    preload_fonts()
+    routes = {"/news/1": Route(PAGE), "/p.jpg": Route(b"busy", content_type="text/plain", status=503)}
+    with StandinServer(routes) as server, tempfile.TemporaryDirectory() as cache_dir:
+        for host in ("flaky.example", "cdn.flaky.example", "slow.example", "fast.example"):
+            http_client.override_host(host, server.base_url)
+        image_cache.directory = cache_dir
+        print(f"{'scenario':<34}{'cb':>4}{'total':>11}{'slowest':>12}{'last':>12}")
+
+        spec = CardSpec("শিরোনাম", "https://cdn.flaky.example/p.jpg")
+        for breaker in (False, True):
+            run("image CDN answers 503", breaker, args.cards, lambda: draw_card(spec))
+
+        routes["/hang"] = Route(PAGE, delay=args.hang)
+        server.routes.update(routes)
+        for breaker in (False, True):
+            run(f"article host hangs {args.hang:g} s", breaker, args.cards, lambda: fetch_article_meta("https://slow.example/hang", timeout=args.timeout))
+
+        # A fast host's timeout shrinks to its latency; when it stalls,
+        # requests give up after that instead of the caller's 10 s.
+        host_health.clear()
+        host_health.timeout_min = 0.5
+        server.routes["/fast"] = Route(PAGE, delay=0.02)
+        timed(20, lambda: fetch_article_meta("https://fast.example/fast"))
+        adaptive = host_health.timeout("fast.example", 10)
+        server.routes["/fast"] = Route(PAGE, delay=args.hang)
+        stalled = timed(1, lambda: fetch_article_meta("https://fast.example/fast"))[0]
+        print(f"fast host stalls: timeout {adaptive:.2f} s instead of 10 s, gave up after {stalled:.2f} s")
+
+        # An expired article is served from the cache once the breaker opens.
+        host_health.clear()
+        article_cache.clear()
+        article_cache.ttl = 0
+        extract_news_data("https://flaky.example/news/1")
+        server.routes["/news/1"] = Route(b"busy", content_type="text/plain", status=503)
+        outcomes = []
+        for _ in range(host_health.failures + 2):
+            try:
+                extract_news_data("https://flaky.example/news/1")
+                outcomes.append("stale")
+            except Exception:
+                outcomes.append("error")
+        print(f"article host answers 503: {', '.join(outcomes)} ({article_cache.stats()['stale']} served stale)")
+
+        # After the cooldown one probe goes through and closes the breaker.
+        server.routes["/news/1"] = Route(PAGE)
+        try:
+            fetch_article_meta("https://flaky.example/news/1")
+            raise SystemExit("breaker did not fail fast")
+        except HostUnavailable as e:
+            print(f"while open: {e}")
+        host_health.cooldown = 0.5
+        time.sleep(0.6)
+        fetch_article_meta("https://flaky.example/news/1")
+        state = next(row["state"] for row in host_health.snapshot() if row["host"] == "flaky.example")
+        print(f"after the cooldown the probe succeeded; breaker {state}")
+        http_client.clear_host_overrides()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark: reduced-scale decode (JPEG draft + reducing_gap resize) against
+a full-resolution decode and a single LANCZOS resize, over large synthetic
+camera-sized photos.
+
+Fixtures are generated and each measurement runs in a fresh process, so peak
+RSS is attributable to that decode alone (Linux carries a parent's peak RSS
+over into a forked child).
+
+    python benchmarks/bench_large_decode.py [--sizes 12,24,50] [--repeat N]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from image_ingest import cover_size, ingest_image, resize_cover  # noqa: E402
+
+TARGET_SIZE = (1080, 700)
+
+
+def make_fixture(path, megapixels, fmt):
+    # A smooth gradient with sensor-like noise compresses like a real photo.
+    width = int((megapixels * 1_000_000 * 3 / 2) ** 0.5)
+    height = int(width * 2 / 3)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 24)
+    image = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    if fmt == "JPEG":
+        image.save(path, "JPEG", quality=90)
+    else:
+        image.save(path, "PNG", compress_level=1)
+
+
+def full_decode(data):
+    image = ingest_image(data, max_pixels=None).image
+    new_size = cover_size(image.size, TARGET_SIZE)
+    image = image.resize(new_size, Image.Resampling.LANCZOS)
+    left = (new_size[0] - TARGET_SIZE[0]) // 2
+    top = (new_size[1] - TARGET_SIZE[1]) // 2
+    return image.crop((left, top, left + TARGET_SIZE[0], top + TARGET_SIZE[1]))
+
+
+def reduced_decode(data):
+    return resize_cover(ingest_image(data, cover=TARGET_SIZE, max_pixels=None).image, TARGET_SIZE)
+
+
+def child(mode, path):
+    with open(path, "rb") as f:
+        data = f.read()
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    image = (full_decode if mode == "full" else reduced_decode)(data)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert image.size == TARGET_SIZE
+    print(json.dumps({"ms": elapsed * 1000, "peak_mb": peak_kb / 1024, "delta_mb": (peak_kb - baseline_kb) / 1024}))
+
+
+def measure(mode, path, repeat):
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, __file__, "--child", mode, path], check=True, capture_output=True, text=True)
+        runs.append(json.loads(out.stdout))
+    return min(run["ms"] for run in runs), max(run["delta_mb"] for run in runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="12,24,50", help="megapixel sizes of the fixtures")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    parser.add_argument("--make", nargs=3, metavar=("PATH", "MEGAPIXELS", "FORMAT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+    if args.make:
+        make_fixture(args.make[0], int(args.make[1]), args.make[2])
+        return
+
+    with tempfile.TemporaryDirectory() as fixtures:
+        print(f"{'fixture':<14}{'file MB':>9}{'full ms':>10}{'full MB':>10}{'reduced ms':>12}{'reduced MB':>12}")
+        for megapixels in (int(size) for size in args.sizes.split(",")):
+            for fmt in ("JPEG", "PNG"):
+                path = os.path.join(fixtures, f"{megapixels}mp.{fmt.lower()}")
+                subprocess.run([sys.executable, __file__, "--make", path, str(megapixels), fmt], check=True)
+                full_ms, full_mb = measure("full", path, args.repeat)
+                reduced_ms, reduced_mb = measure("reduced", path, args.repeat)
+                print(
+                    f"{os.path.basename(path):<14}{os.path.getsize(path) / 1024 / 1024:>9.1f}"
+                    f"{full_ms:>10.0f}{full_mb:>10.0f}{reduced_ms:>12.0f}{reduced_mb:>12.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
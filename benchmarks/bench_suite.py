@@ -0,0 +1,300 @@
+"""Benchmark suite: the card pipeline stage by stage and end to end, offline
+and on fixed fixtures.
+
+    extract/<page>       extract_news_data on saved publisher pages served by
+                         the HTTP stand-in (metadata cache cleared each run)
+    process_image/<src>  process_image on generated photos from 0.3 to 50 MP
+                         (image cache cleared each run)
+    layout/<format>      compiling a layout: bundled images decoded, fitted
+                         and faded (layout cache cleared each run)
+    headline/<text>      adjust_headline on short and long Bengali and English
+                         headlines (text metrics cache cleared each run)
+    card/cold            draw_card + PNG download encode with the template
+                         and image caches cleared
+    card/warm            the same card again, everything cached
+
+Each case runs in a fresh process: a few warm-up runs, then --repeat timed
+runs. Reported are latency percentiles, peak RSS above the process's RSS
+once its fixtures are loaded, and the mean milliseconds per stage_timing
+stage. Results are saved as JSON; with a baseline (benchmarks/baseline.json
+by default, written by --save-baseline) every case whose p50 or memory grew
+by more than --threshold is flagged and the exit status is 1. Baselines are
+only comparable on the machine that recorded them.
+
+    python benchmarks/bench_suite.py [--filter TEXT] [--repeat N] [--out PATH]
+                                     [--baseline PATH] [--save-baseline]
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+
+import numpy as np
+import PIL
+from PIL import Image, ImageDraw
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import http_client  # noqa: E402
+from card_encoding import encode_image  # noqa: E402
+from card_layout import LAYOUT_DIR, compile_layout  # noqa: E402
+from card_renderer import (  # noqa: E402
+    CARD_FORMATS, CardSpec, adjust_headline, draw_card, extract_news_data, get_card_format, preload_fonts, process_image,
+)
+from http_standin import Route, StandinServer  # noqa: E402
+from image_cache import image_cache  # noqa: E402
+from meta_cache import article_cache  # noqa: E402
+from stage_timing import trace_card  # noqa: E402
+from template_cache import template_cache  # noqa: E402
+from text_metrics import text_measurer  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+GENERATED = os.path.join(ROOT, ".cache", "bench-fixtures")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_OUT = os.path.join(ROOT, ".cache", "bench-results.json")
+
+# name -> (megapixels, format)
+PHOTOS = {
+    "0.3mp-jpeg": (0.3, "JPEG"),
+    "2mp-jpeg": (2, "JPEG"),
+    "2mp-png": (2, "PNG"),
+    "12mp-jpeg": (12, "JPEG"),
+    "50mp-jpeg": (50, "JPEG"),
+}
+CARD_PHOTO = "2mp-jpeg"
+WARMUP = 2
+
+
+def photo_path(name):
+    megapixels, fmt = PHOTOS[name]
+    return os.path.join(GENERATED, f"{name}.{fmt.lower()}")
+
+
+def make_photo(name):
+    # Seeded, so every machine benchmarks the same pixels: 3:2 gradients with
+    # sensor-like noise, which compress like a real photo.
+    megapixels, fmt = PHOTOS[name]
+    width = int((megapixels * 1_000_000 * 3 / 2) ** 0.5)
+    height = int(width * 2 / 3)
+    rng = np.random.default_rng(int(megapixels * 10))
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[..., 0] = np.linspace(0, 255, width, dtype=np.float32).astype(np.uint8)
+    pixels[..., 1] = rng.integers(80, 160, size=(height, width), dtype=np.uint8)
+    pixels[..., 2] = np.linspace(255, 0, height, dtype=np.float32).astype(np.uint8)[:, None]
+    path = photo_path(name)
+    os.makedirs(GENERATED, exist_ok=True)
+    tmp_path = path + ".tmp"
+    if fmt == "JPEG":
+        Image.fromarray(pixels).save(tmp_path, "JPEG", quality=90)
+    else:
+        Image.fromarray(pixels).save(tmp_path, "PNG", compress_level=1)
+    os.replace(tmp_path, path)
+
+
+def read_fixture(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def html_pages():
+    return {os.path.basename(path)[:-len(".html")]: path for path in sorted(glob.glob(os.path.join(FIXTURES, "html", "*.html")))}
+
+
+def headlines():
+    with open(os.path.join(FIXTURES, "headlines.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Each case builder sets up its fixtures and returns (reset, run): reset is
+# called untimed before every run.
+def extract_case(stack, page):
+    server = stack.enter_context(StandinServer({"/news": Route(read_fixture(html_pages()[page]))}))
+    http_client.override_host("news.example", server.base_url)
+    stack.callback(http_client.clear_host_overrides)
+    return article_cache.clear, lambda: extract_news_data("https://news.example/news")
+
+
+def process_image_case(stack, name):
+    data = read_fixture(photo_path(name))
+    crops = os.path.join(image_cache.directory, "crops")
+    return lambda: shutil.rmtree(crops, ignore_errors=True), lambda: process_image(data)
+
+
+def headline_case(stack, name):
+    _, headline = headlines()[name]
+    draw = ImageDraw.Draw(Image.new("RGB", get_card_format("feed").size))
+    return text_measurer.clear, lambda: adjust_headline(headline, draw)
+
+
+def card_case(stack, cache):
+    spec = CardSpec(headlines()["bengali-long"][1], read_fixture(photo_path(CARD_PHOTO)), datetime.datetime(2025, 6, 3, 13, 54), "প্রথম আলো")
+    crops = os.path.join(image_cache.directory, "crops")
+
+    def reset():
+        if cache == "cold":
+            template_cache.clear()
+            text_measurer.clear()
+            shutil.rmtree(crops, ignore_errors=True)
+
+    return reset, lambda: encode_image(draw_card(spec), "download")
+
+
+def all_cases():
+    cases = {}
+    for page in html_pages():
+        cases[f"extract/{page}"] = lambda stack, page=page: extract_case(stack, page)
+    for name in PHOTOS:
+        cases[f"process_image/{name}"] = lambda stack, name=name: process_image_case(stack, name)
+    for name in CARD_FORMATS:
+        cases[f"layout/{name}"] = lambda stack, name=name: (None, lambda: compile_layout(name, os.path.join(LAYOUT_DIR, f"{name}.json")))
+    for name in headlines():
+        cases[f"headline/{name}"] = lambda stack, name=name: headline_case(stack, name)
+    for cache in ("cold", "warm"):
+        cases[f"card/{cache}"] = lambda stack, cache=cache: card_case(stack, cache)
+    return cases
+
+
+def percentile(sorted_samples, fraction):
+    index = (len(sorted_samples) - 1) * fraction
+    lower = int(index)
+    upper = min(lower + 1, len(sorted_samples) - 1)
+    return sorted_samples[lower] + (sorted_samples[upper] - sorted_samples[lower]) * (index - lower)
+
+
+def run_case(name, repeat):
+    # Runs in the child process; returns the case's result record.
+    with ExitStack() as stack:
+        image_cache.directory = stack.enter_context(tempfile.TemporaryDirectory())
+        preload_fonts()
+        reset, run = all_cases()[name](stack)
+        baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        samples = []
+        stages = {}
+        for iteration in range(WARMUP + repeat):
+            if reset:
+                reset()
+            with trace_card() as trace:
+                start = time.perf_counter()
+                run()
+                elapsed = (time.perf_counter() - start) * 1000
+            if iteration < WARMUP:
+                continue
+            samples.append(elapsed)
+            for stage_name, ms in trace.as_dict().items():
+                stages[stage_name] = stages.get(stage_name, 0.0) + ms / repeat
+
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    samples.sort()
+    return {
+        "p50_ms": percentile(samples, 0.5),
+        "p90_ms": percentile(samples, 0.9),
+        "p99_ms": percentile(samples, 0.99),
+        "mean_ms": statistics.fmean(samples),
+        "min_ms": samples[0],
+        "max_ms": samples[-1],
+        "peak_mb": peak_kb / 1024,
+        "delta_mb": (peak_kb - baseline_kb) / 1024,
+        "stages_ms": stages,
+    }
+
+
+def regressions(result, baseline, threshold):
+    # Changes small in absolute terms are noise, whatever the ratio.
+    found = []
+    if result["p50_ms"] > baseline["p50_ms"] * (1 + threshold) and result["p50_ms"] - baseline["p50_ms"] > 1.0:
+        found.append(f"p50 {baseline['p50_ms']:.1f} -> {result['p50_ms']:.1f} ms")
+    if result["delta_mb"] > baseline["delta_mb"] * (1 + threshold) and result["delta_mb"] - baseline["delta_mb"] > 8.0:
+        found.append(f"memory {baseline['delta_mb']:.0f} -> {result['delta_mb']:.0f} MB")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="only cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--out", default=DEFAULT_OUT, help="where to write the results JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed growth over the baseline (default: 0.2 = 20%%)")
+    parser.add_argument("--child", metavar="CASE", help=argparse.SUPPRESS)
+    parser.add_argument("--make", metavar="PHOTO", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    if args.child:
+        print(json.dumps(run_case(args.child, args.repeat)))
+        return
+    if args.make:
+        make_photo(args.make)
+        return
+
+    names = [name for name in all_cases() if args.filter in name]
+    photos = {photo for photo in PHOTOS if f"process_image/{photo}" in names}
+    if any(name.startswith("card/") for name in names):
+        photos.add(CARD_PHOTO)
+    for photo in sorted(photos):
+        if not os.path.exists(photo_path(photo)):
+            print(f"generating {os.path.basename(photo_path(photo))}", file=sys.stderr)
+            # In a child process: Linux carries a parent's peak RSS over into
+            # the children that measure memory.
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--make", photo], check=True)
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["cases"]
+
+    results = {}
+    flagged = {}
+    print(f"{'case':<28}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'mem MB':>8}  slowest stages")
+    for name in names:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", name, "--repeat", str(args.repeat)],
+            check=True, capture_output=True, text=True,
+        )
+        result = results[name] = json.loads(out.stdout.splitlines()[-1])
+        top = sorted(result["stages_ms"].items(), key=lambda item: -item[1])[:3]
+        line = (
+            f"{name:<28}{result['p50_ms']:>9.1f}{result['p90_ms']:>9.1f}{result['p99_ms']:>9.1f}{result['delta_mb']:>8.0f}  "
+            + ", ".join(f"{stage_name} {ms:.1f}" for stage_name, ms in top)
+        )
+        if name in baseline:
+            flagged[name] = regressions(result, baseline[name], args.threshold)
+            if flagged[name]:
+                line += "  REGRESSION: " + "; ".join(flagged[name])
+        print(line, flush=True)
+
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "pillow": PIL.__version__, "platform": platform.platform(), "cpus": os.cpu_count()},
+        "repeat": args.repeat,
+        "cases": results,
+    }
+    path = args.baseline if args.save_baseline else args.out
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"results written to {path}")
+
+    regressed = [name for name, found in flagged.items() if found]
+    if regressed:
+        raise SystemExit(f"{len(regressed)} case(s) regressed against {args.baseline}: {', '.join(regressed)}")
+
+
+if __name__ == "__main__":
+    main()
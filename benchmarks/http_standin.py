@@ -0,0 +1,85 @@
+"""Local HTTP stand-in for publisher sites, used by the benchmarks.
+
+Serves canned responses from memory on 127.0.0.1 with keep-alive, so fetch
+code can be exercised offline through http_client.override_host().
+"""
+
+import http.server
+import sys
+import threading
+import time
+
+
+class Route:
+    def __init__(self, body, content_type="text/html; charset=utf-8", status=200, headers=None, delay=0.0):
+        self.body = body
+        self.content_type = content_type
+        self.status = status
+        self.headers = headers or {}
+        self.delay = delay
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        route = self.server.routes.get(self.path.split("?", 1)[0])
+        self.server.requests.append((self.headers.get("Host"), self.path))
+        if route is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if route.delay:
+            time.sleep(route.delay)
+        etag = route.headers.get("ETag")
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(route.status)
+        self.send_header("Content-Type", route.content_type)
+        self.send_header("Content-Length", str(len(route.body)))
+        for name, value in route.headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(route.body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Clients that stop reading early (streamed head parsing) hang up.
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandinServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # Concurrent clients open dozens of connections at once; the default
+    # backlog of 5 turns the rest into 1 s SYN retransmits.
+    request_queue_size = 128
+
+    def __init__(self, routes=None):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.routes = dict(routes or {})
+        self.requests = []
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def handle_error(self, request, client_address):
+        # Early hang-ups are expected; anything else is still reported.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,62 @@
+import os
+from io import BytesIO
+from typing import NamedTuple
+
+from stage_timing import stage
+
+# Output formats for a rendered card. Measured on a 1080x1200 photo card
+# (benchmarks/bench_encoding.py has the full table):
+#
+#   png-fast           ~95 ms   ~880 KB   zlib level 1
+#   png                ~250 ms  ~785 KB   Pillow's default level 6
+#   png-optimized      ~1 s     ~765 KB
+#   jpeg               ~11 ms   ~295 KB   quality 90, no chroma subsampling
+#   jpeg-progressive   ~45 ms   ~270 KB   as jpeg, progressive + optimized tables
+#   webp               ~165 ms  ~95 KB    lossy, quality 80
+#   webp-lossless      ~75 ms   ~630 KB   fastest lossless effort
+#
+# Chroma subsampling is off for JPEG because it smears the coloured text on
+# the card. Each use case picks a profile; CARD_<USE CASE>_PROFILE overrides it.
+class EncodeProfile(NamedTuple):
+    format: str
+    mime: str
+    extension: str
+    params: dict
+
+
+PROFILES = {
+    "png-fast": EncodeProfile("PNG", "image/png", "png", {"compress_level": 1}),
+    "png": EncodeProfile("PNG", "image/png", "png", {"compress_level": 6}),
+    "png-optimized": EncodeProfile("PNG", "image/png", "png", {"optimize": True}),
+    "jpeg": EncodeProfile("JPEG", "image/jpeg", "jpg", {"quality": 90, "subsampling": 0}),
+    "jpeg-progressive": EncodeProfile("JPEG", "image/jpeg", "jpg", {"quality": 90, "subsampling": 0, "progressive": True, "optimize": True}),
+    "webp": EncodeProfile("WEBP", "image/webp", "webp", {"quality": 80, "method": 4}),
+    "webp-lossless": EncodeProfile("WEBP", "image/webp", "webp", {"lossless": True, "quality": 0, "method": 0}),
+}
+
+USE_CASE_PROFILES = {
+    # Shown in the browser right after generating: fast and small.
+    "preview": os.environ.get("CARD_PREVIEW_PROFILE", "jpeg"),
+    # The file users save: lossless, without the slow compression levels.
+    "download": os.environ.get("CARD_DOWNLOAD_PROFILE", "png-fast"),
+    # Uploaded to social networks, which re-encode anyway.
+    "social": os.environ.get("CARD_SOCIAL_PROFILE", "jpeg-progressive"),
+}
+
+
+def get_profile(name):
+    # name is a profile or a use case.
+    name = USE_CASE_PROFILES.get(name, name)
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown output profile: {name}") from None
+
+
+def encode_image(image, profile="download", **params):
+    # params override the profile's settings, e.g. quality=75.
+    profile = get_profile(profile)
+    with stage("encode"):
+        buf = BytesIO()
+        image.save(buf, format=profile.format, **dict(profile.params, **params))
+    return buf.getvalue()
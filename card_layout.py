@@ -0,0 +1,320 @@
+import json
+import os
+import threading
+from collections import namedtuple
+
+from PIL import Image, ImageColor, ImageDraw
+
+from compositing import alpha_over, fill_color, fit_within, scale_alpha
+from font_registry import font_registry
+from headline_fit import draw_headline
+from text_metrics import text_measurer
+
+# Card layouts are JSON files in LAYOUT_DIR, one per output format (the file
+# name is the format name), so a new format needs no code. A layout gives the
+# canvas "size", a "background" color and "layers", drawn in order:
+#
+#   {"fill": color, "box": box, "opacity": 1.0}
+#   {"image": path, "box": box, "fit": "stretch" | "width" | "contain",
+#    "max_size": [w, h], "anchor": "center", "opacity": 1.0, "opaque": false,
+#    "missing": [layers drawn instead when the file does not exist]}
+#   {"text": text or {language: text, "default": text}, "font": [role, size],
+#    "color": color, "box": box, "align": "left" | "center" | "right"}
+#    (or "at": [x, y] with an optional Pillow "anchor" such as "mm")
+#   {"asset": "custom_logo" | "custom_ad", "box": box, "anchor": "center"}
+#
+# and the per-article slots:
+#
+#   {"slot": "photo", "box": box, "crop": [w, h], "missing": [layers]}
+#   {"slot": "headline", "box": box, "font": role, "sizes": [min, max], "color": color}
+#   {"slot": "source" | "date", ...a text layer; "{source}" and "{date}" are filled in}
+#
+# Boxes are Pillow boxes (right/bottom exclusive). Colors starting with "$"
+# name a CardStyle field, and "when" names a CardStyle flag the layer needs.
+# Image paths are relative to ASSET_DIR, where the bundled assets are. An
+# asset layer's "max_size" (default: its box) is what uploads are fitted to. "fit": "width" scales to the box width and centres vertically,
+# cropping or padding; the photo is cropped to "crop" and its top-left part
+# pasted into the box; text in the photo's "missing" layers can use
+# "{photo_error}".
+#
+# Each layout is compiled once per process into a RenderPlan: bundled images
+# are decoded, fitted and faded, fonts looked up, and the layers split into
+# static ops, drawn into the (cached) template for a style and language, and
+# slot ops, which are all that is drawn per card.
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+LAYOUT_DIR = os.environ.get("CARD_LAYOUT_DIR", os.path.join(ASSET_DIR, "layouts"))
+
+SLOTS = ("photo", "headline", "source", "date")
+
+# run(canvas, draw, args, style, language, values); when is a CardStyle flag or None.
+Op = namedtuple("Op", "run args when")
+HeadlineBox = namedtuple("HeadlineBox", "width height role min_size max_size")
+
+
+class LayoutError(ValueError):
+    pass
+
+
+def _color(color, style):
+    return getattr(style, color[1:]) if color.startswith("$") else color
+
+
+def _style_key(value):
+    # Custom assets are keyed on their digest, not their pixels.
+    return getattr(value, "digest", value)
+
+
+def _place(size, box, anchor):
+    if anchor == "center":
+        return (box[0] + (box[2] - box[0] - size[0]) // 2, box[1] + (box[3] - box[1] - size[1]) // 2)
+    return (box[0], box[1])
+
+
+def fit_image(image, size, fit, max_size=None):
+    if fit == "stretch":
+        return image.resize(size, Image.Resampling.LANCZOS)
+    if fit == "contain":
+        return fit_within(image, max_size or size)
+    if fit == "width":
+        width, height = size
+        image = image.resize((width, int(width / (image.width / image.height))), Image.Resampling.LANCZOS)
+        if image.height > height:
+            top = (image.height - height) // 2
+            return image.crop((0, top, width, top + height))
+        padded = Image.new(image.mode, size)
+        padded.paste(image, (0, (height - image.height) // 2))
+        return padded
+    return image
+
+
+def _run_fill(canvas, draw, args, style, language, values):
+    box, color, opacity = args
+    fill_color(canvas, box or (0, 0) + canvas.size, _color(color, style), opacity)
+
+
+def _run_paste(canvas, draw, args, style, language, values):
+    image, position = args
+    alpha_over(canvas, image, position)
+
+
+def _run_text(canvas, draw, args, style, language, values):
+    text, font, color, box, align, anchor = args
+    if isinstance(text, dict):
+        text = text.get(language, text.get("default", ""))
+    if values is not None:
+        text = text.format_map(values)
+    if align == "center":
+        position = (box[0] + (box[2] - box[0] - text_measurer.width(font, text)) // 2, box[1])
+    elif align == "right":
+        position = (box[2] - text_measurer.width(font, text), box[1])
+    else:
+        position = (box[0], box[1])
+    draw.text(position, text, fill=_color(color, style), font=font, anchor=anchor)
+
+
+def _run_asset(canvas, draw, args, style, language, values):
+    name, box, anchor = args
+    asset = getattr(style, name)
+    if asset is not None:
+        alpha_over(canvas, asset.image, _place(asset.image.size, box, anchor))
+
+
+def _run_photo(canvas, draw, args, style, language, values):
+    # The rest of the crop is covered by later layers, so only the part in
+    # the box is pasted.
+    box, missing = args
+    photo = values.get("photo")
+    if photo is not None:
+        canvas.paste(photo.crop((0, 0, box[2] - box[0], box[3] - box[1])), box[:2])
+        return
+    for op in missing:
+        op.run(canvas, draw, op.args, style, language, values)
+
+
+def _run_headline(canvas, draw, args, style, language, values):
+    box, color = args
+    draw_headline(draw, values["headline"], box[:2], box[2] - box[0], fill=_color(color, style))
+
+
+class RenderPlan:
+    def __init__(self, name, size, background, static_ops, slot_ops, style_fields, photo_size=None, headline=None, headline_origin=None, asset_sizes=None, font_sizes=None):
+        self.name = name
+        self.size = size
+        self.background = background
+        self.static_ops = static_ops
+        self.slot_ops = slot_ops
+        # CardStyle fields the static ops read: the template cache key.
+        self.style_fields = style_fields
+        # Size of the photo crop the photo slot wants, and the headline box.
+        self.photo_size = photo_size
+        self.headline = headline
+        self.headline_origin = headline_origin
+        # Size each custom asset is fitted to, and {font role: sizes used}.
+        self.asset_sizes = asset_sizes or {}
+        self.font_sizes = font_sizes or {}
+
+    def template_key(self, style, language):
+        return (self.name, language) + tuple(_style_key(getattr(style, field)) for field in self.style_fields)
+
+    def build_template(self, style, language):
+        canvas = Image.new("RGB", self.size, _color(self.background, style))
+        _run_ops(self.static_ops, canvas, style, language, None)
+        return canvas
+
+    def draw(self, canvas, style, language, values):
+        # values: "photo" (the crop, or None), "photo_error", "headline" (a
+        # fitted HeadlineLayout), "source" and "date".
+        _run_ops(self.slot_ops, canvas, style, language, values)
+        return canvas
+
+
+def _run_ops(ops, canvas, style, language, values):
+    draw = ImageDraw.Draw(canvas)
+    for op in ops:
+        if op.when is None or getattr(style, op.when):
+            op.run(canvas, draw, op.args, style, language, values)
+
+
+class _Compiler:
+    def __init__(self, path):
+        self.path = path
+        self.style_fields = set()
+        self.asset_sizes = {}
+        self.font_sizes = {}
+
+    def error(self, message):
+        return LayoutError(f"{self.path}: {message}")
+
+    def box(self, layer, key="box"):
+        box = layer.get(key)
+        if box is None or len(box) != (2 if key == "at" else 4):
+            raise self.error(f"layer needs {key}: {layer}")
+        return tuple(box)
+
+    def color(self, color):
+        if not isinstance(color, str):
+            raise self.error(f"color must be a string such as \"#e41b17\" or \"$primary_color\": {color!r}")
+        if color.startswith("$"):
+            self.style_fields.add(color[1:])
+            return color
+        try:
+            ImageColor.getrgb(color)
+        except ValueError:
+            raise self.error(f"unknown color: {color}") from None
+        return color
+
+    def font(self, layer):
+        try:
+            role, size = layer["font"]
+            font = font_registry.get(role, size)
+        except (KeyError, TypeError, ValueError):
+            raise self.error(f"layer needs font [role, size]: {layer}") from None
+        self.font_sizes.setdefault(role, set()).add(size)
+        return font
+
+    def when(self, layer):
+        when = layer.get("when")
+        if when is not None:
+            self.style_fields.add(when)
+        return when
+
+    def static(self, layer):
+        # Ops for one static layer; a missing image compiles to its fallback.
+        when = self.when(layer)
+        if "fill" in layer:
+            return [Op(_run_fill, (tuple(layer["box"]) if "box" in layer else None, self.color(layer["fill"]), layer.get("opacity", 1.0)), when)]
+        if "image" in layer:
+            path = os.path.join(ASSET_DIR, layer["image"])
+            if not os.path.exists(path):
+                return [op._replace(when=op.when or when) for missing in layer.get("missing", []) for op in self.static(missing)]
+            box = self.box(layer)
+            image = Image.open(path).convert("RGB" if layer.get("opaque") else "RGBA")
+            image = fit_image(image, (box[2] - box[0], box[3] - box[1]), layer.get("fit"), layer.get("max_size"))
+            if "opacity" in layer:
+                image = scale_alpha(image, layer["opacity"])
+            return [Op(_run_paste, (image, _place(image.size, box, layer.get("anchor"))), when)]
+        if "text" in layer:
+            return [self.text(layer, when)]
+        if "asset" in layer:
+            self.style_fields.add(layer["asset"])
+            box = self.box(layer)
+            self.asset_sizes[layer["asset"]] = tuple(layer.get("max_size") or (box[2] - box[0], box[3] - box[1]))
+            return [Op(_run_asset, (layer["asset"], box, layer.get("anchor")), when)]
+        raise self.error(f"unknown layer: {layer}")
+
+    def text(self, layer, when=None):
+        box = self.box(layer, "at" if "at" in layer else "box")
+        return Op(_run_text, (layer["text"], self.font(layer), self.color(layer.get("color", "white")), box, layer.get("align"), layer.get("anchor")), when)
+
+    def slot(self, layer):
+        name = layer["slot"]
+        when = layer.get("when")
+        if name == "photo":
+            # Fallback layers are drawn per card too, so they are not static.
+            missing = [op for fallback in layer.get("missing", []) for op in self.static(fallback)]
+            return Op(_run_photo, (self.box(layer), missing), when)
+        if name == "headline":
+            return Op(_run_headline, (self.box(layer), self.color(layer.get("color", "white"))), when)
+        if name in SLOTS:
+            return self.text(layer, when)
+        raise self.error(f"unknown slot {name!r}; slots are {', '.join(SLOTS)}")
+
+    def compile(self, name, layout):
+        static_ops, slot_ops = [], []
+        photo_size = headline = headline_origin = None
+        for layer in layout.get("layers", []):
+            if "slot" not in layer:
+                static_ops.extend(self.static(layer))
+                continue
+            slot_ops.append(self.slot(layer))
+            if layer["slot"] == "photo":
+                photo_size = tuple(layer.get("crop") or slot_ops[-1].args[0][2:])
+            elif layer["slot"] == "headline":
+                box = slot_ops[-1].args[0]
+                min_size, max_size = layer["sizes"]
+                headline = HeadlineBox(box[2] - box[0], box[3] - box[1], layer.get("font", "bold"), min_size, max_size)
+                headline_origin = box[:2]
+                self.font_sizes.setdefault(headline.role, set()).update(range(min_size, max_size + 1))
+        background = self.color(layout.get("background", "white"))
+        return RenderPlan(
+            name, tuple(layout["size"]), background, static_ops, slot_ops, tuple(sorted(self.style_fields)),
+            photo_size, headline, headline_origin, self.asset_sizes, {role: sorted(sizes) for role, sizes in self.font_sizes.items()},
+        )
+
+
+def compile_layout(name, path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            layout = json.load(f)
+    except (OSError, ValueError) as e:
+        raise LayoutError(f"{path}: {e}") from None
+    try:
+        return _Compiler(path).compile(name, layout)
+    except (KeyError, TypeError) as e:
+        raise LayoutError(f"{path}: bad layout ({e!r})") from None
+
+
+def layout_names(directory=LAYOUT_DIR):
+    try:
+        return tuple(sorted(name[:-5] for name in os.listdir(directory) if name.endswith(".json")))
+    except OSError:
+        return ()
+
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def load_plan(name, directory=LAYOUT_DIR):
+    # Compiled once per process; the lock keeps concurrent renders from
+    # compiling the same layout twice.
+    with _plans_lock:
+        plan = _plans.get((directory, name))
+        if plan is None:
+            names = layout_names(directory)
+            if not names:
+                raise LayoutError(f"No card layouts found: {directory} is missing or has no .json files")
+            if name not in names:
+                raise LayoutError(f"Unknown card format: {name}")
+            plan = _plans[(directory, name)] = compile_layout(name, os.path.join(directory, f"{name}.json"))
+        return plan
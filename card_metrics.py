@@ -0,0 +1,217 @@
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from custom_assets import asset_cache
+from font_registry import font_registry
+from host_health import host_health
+from image_cache import image_cache
+from meta_cache import article_cache
+from template_cache import template_cache
+from text_metrics import text_measurer
+
+# Process-wide counters and histograms, served in the Prometheus text format
+# on http://CARD_METRICS_HOST:CARD_METRICS_PORT/metrics (0 turns the server
+# off). Recording is a dict lookup and a few additions under a lock, cheap
+# enough to leave on. Sources are the mapped outlet names (see source_label
+# in card_renderer), so the number of series stays bounded. Card series also
+# carry the "use" a card was rendered for (CARD_USES): app previews are small
+# JPEGs redrawn on every edit and are kept apart from real output. Cache hit and
+# miss counts are read from the caches' own stats() when scraped.
+METRICS_HOST = os.environ.get("CARD_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("CARD_METRICS_PORT", 8511))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = tuple(kb * 1024 for kb in (16, 64, 128, 256, 512, 1024, 2048, 4096))
+CARD_USES = ("preview", "download", "service")
+
+CACHES = {
+    "image": image_cache,
+    "article": article_cache,
+    "template": template_cache,
+    "asset": asset_cache,
+    "font": font_registry,
+    "text_metrics": text_measurer,
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {label_values: (list(counts), total) for label_values, (counts, total) in self._series.items()}
+        names = self.labels + ("le",)
+        for label_values, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(names, label_values + (bound,)), cumulative
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class CacheStats:
+    # Hit and miss counters taken from each cache's stats() at scrape time.
+    def __init__(self, name, documentation, key, caches=CACHES):
+        self.name = name
+        self.documentation = documentation
+        self.key = key
+        self.kind = "counter"
+        self.caches = caches
+
+    def samples(self):
+        for cache_name, cache in self.caches.items():
+            stats = cache.stats()
+            yield self.name, _format_labels(("cache",), (cache_name,)), stats[self.key]
+            if cache_name == "image" and self.key == "hits":
+                yield self.name, _format_labels(("cache",), ("image_crop",)), stats["crop_hits"]
+
+
+class Sampled:
+    # A single value read when scraped.
+    def __init__(self, name, documentation, kind, read):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.read = read
+
+    def samples(self):
+        yield self.name, "", self.read()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+article_fetch_seconds = registry.register(Histogram(
+    "card_article_fetch_seconds", "Time to get an article's metadata, cache hits included.", ("source", "outcome")))
+image_downloads = registry.register(Counter(
+    "card_image_download_attempts_total", "Photo download attempts by outcome (ok, retry, error, rejected).", ("source", "outcome")))
+card_seconds = registry.register(Histogram(
+    "card_render_seconds", "Time to produce one card, fetching included.", ("use", "source", "outcome")))
+stage_seconds = registry.register(Histogram(
+    "card_stage_seconds", "Time spent in each stage of a card.", ("use", "stage", "source")))
+output_bytes = registry.register(Histogram(
+    "card_output_bytes", "Size of encoded cards.", ("use", "format"), buckets=SIZE_BUCKETS))
+registry.register(CacheStats("card_cache_hits_total", "Cache hits.", "hits"))
+registry.register(CacheStats("card_cache_misses_total", "Cache misses.", "misses"))
+registry.register(Sampled("card_host_breakers_open", "Publisher hosts whose circuit breaker is open.", "gauge", lambda: host_health.stats()["open"]))
+registry.register(Sampled("card_host_requests_rejected_total", "Requests failed fast by an open circuit breaker.", "counter", lambda: host_health.stats()["rejected"]))
+
+
+def observe_card(use, source, outcome, stages_ms=None, total_ms=None, output=None, output_format=None):
+    # One finished (or failed) card rendered for use (one of CARD_USES):
+    # stages_ms as from StageTrace.as_dict().
+    if total_ms is not None:
+        card_seconds.observe(total_ms / 1000, use, source, outcome)
+    for stage_name, ms in (stages_ms or {}).items():
+        stage_seconds.observe(ms / 1000, use, stage_name, source)
+    if output is not None:
+        output_bytes.observe(len(output), use, output_format)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    # Idempotent, so Streamlit reruns can call it. Returns the server, or None
+    # when disabled or the port is taken (e.g. by another app process).
+    global _server
+    with _server_lock:
+        if _server is None and port:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError:
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="card-metrics", daemon=True).start()
+        return _server
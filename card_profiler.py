@@ -0,0 +1,112 @@
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import random
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from stage_timing import current_trace
+
+# cProfile + tracemalloc capture of single card renders, for the rare card
+# that takes seconds. Off unless one of these is set:
+#
+#   CARD_PROFILE=1                 profile every card
+#   CARD_PROFILE_SAMPLE_RATE=0.01  profile a random 1% of cards
+#   profile_card(force=True)       e.g. the app's hidden ?profile=1 switch
+#
+# Each capture is written to CARD_PROFILE_DIR/<time>-<label>-<pid>-<n>/ as
+# profile.pstats, memory.snapshot (tracemalloc) and summary.txt with the top
+# CARD_PROFILE_TOP functions and allocation sites. With CARD_PROFILE_MIN_MS,
+# captures of faster cards are dropped. tracemalloc only sees Python
+# allocations, not Pillow's pixel buffers, so the summary also records the
+# process's peak RSS. One card is profiled at a time per process; when
+# profiling is off, profile_card costs a flag check.
+PROFILE_ALWAYS = os.environ.get("CARD_PROFILE", "").strip().lower() in ("1", "true", "yes", "on")
+PROFILE_SAMPLE_RATE = float(os.environ.get("CARD_PROFILE_SAMPLE_RATE", 0))
+PROFILE_MIN_MS = float(os.environ.get("CARD_PROFILE_MIN_MS", 0))
+PROFILE_DIR = os.environ.get("CARD_PROFILE_DIR", os.path.join(".cache", "profiles"))
+PROFILE_TOP = int(os.environ.get("CARD_PROFILE_TOP", 25))
+
+_capture_lock = threading.Lock()
+_capture_ids = itertools.count(1)
+
+
+class CardProfile:
+    def __init__(self, label):
+        self.label = label
+        self.elapsed_ms = None
+        # Set once the capture has been written.
+        self.path = None
+        self.summary = None
+
+
+def profiling_wanted(force=False):
+    return force or PROFILE_ALWAYS or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+
+@contextmanager
+def profile_card(label="card", force=False):
+    # Yields a CardProfile while capturing, or None when this card is not
+    # profiled (including while another card is being captured).
+    if not profiling_wanted(force) or not _capture_lock.acquire(blocking=False):
+        yield None
+        return
+    try:
+        profile = CardProfile(label)
+        profiler = cProfile.Profile()
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield profile
+        finally:
+            profiler.disable()
+            profile.elapsed_ms = (time.perf_counter() - start) * 1000
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracemalloc:
+                tracemalloc.stop()
+            if profile.elapsed_ms >= PROFILE_MIN_MS:
+                write_capture(profile, profiler, snapshot)
+    finally:
+        _capture_lock.release()
+
+
+def write_capture(profile, profiler, snapshot, directory=None, top=PROFILE_TOP):
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{profile.label}-{os.getpid()}-{next(_capture_ids)}"
+    path = os.path.join(directory or PROFILE_DIR, name)
+    try:
+        os.makedirs(path, exist_ok=True)
+        profiler.dump_stats(os.path.join(path, "profile.pstats"))
+        snapshot.dump(os.path.join(path, "memory.snapshot"))
+    except OSError:
+        # A profile that cannot be saved must not fail the card.
+        return None
+
+    out = io.StringIO()
+    out.write(f"{profile.label}: {profile.elapsed_ms:.0f} ms, peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB\n")
+    trace = current_trace()
+    if trace is not None:
+        out.write("stages: " + ", ".join(f"{stage_name} {ms:.1f} ms" for stage_name, ms in trace.as_dict().items()) + "\n")
+    for sort in ("cumulative", "tottime"):
+        out.write(f"\n== top {top} functions by {sort} time ==\n")
+        pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(top)
+    out.write(f"\n== top {top} Python allocation sites ==\n")
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    for stat in snapshot.statistics("lineno")[:top]:
+        out.write(f"{stat.size / 1024:>10.1f} KB {stat.count:>8} blocks  {stat.traceback}\n")
+
+    profile.summary = out.getvalue()
+    try:
+        with open(os.path.join(path, "summary.txt"), "w", encoding="utf-8") as f:
+            f.write(profile.summary)
+    except OSError:
+        return None
+    profile.path = path
+    return path
@@ -0,0 +1,313 @@
+import datetime
+import re
+import time
+from typing import NamedTuple, Optional
+from urllib.parse import urlparse
+
+import requests
+from PIL import Image
+
+import http_client
+from article_meta import parse_published_time
+from card_encoding import encode_image
+from card_layout import layout_names, load_plan
+from card_metrics import article_fetch_seconds, image_downloads
+from custom_assets import CustomAsset, asset_cache
+from compositing import fit_within
+from font_registry import font_registry
+from host_health import HostUnavailable, backoff
+from headline_fit import draw_headline, fit_headline
+from image_cache import content_digest, image_cache
+from image_ingest import REDUCING_GAP, cover_size, ingest_image, read_image_bytes, resize_cover
+from meta_cache import article_cache
+from publishers import publisher_registry
+from stage_timing import stage
+from template_cache import template_cache
+
+# Constants. Where things go on each format, and at what size, is in
+# layouts/ (see card_layout); DEFAULT_FORMAT's plan is what custom assets are
+# fitted to and the helpers below default to.
+DEFAULT_FORMAT = "feed"
+PREVIEW_SCALE = 0.4
+
+# Output formats: one per layout file.
+CARD_FORMATS = layout_names()
+
+
+# Everything about a card's look that the user can change. The Streamlit app
+# builds one from session state; card_spec from a batch row or render request.
+# custom_logo and custom_ad are CustomAssets from load_custom_logo and
+# load_custom_ad: already decoded and fitted to their place on the card.
+class CardStyle(NamedTuple):
+    primary_color: str = "#9f2d32"
+    secondary_color: str = "#fbd302"
+    text_color: str = "#ffffff"
+    secondary_text_color: str = "#fbd302"
+    show_logo_box_overlay: bool = True
+    custom_logo: Optional[CustomAsset] = None
+    custom_ad: Optional[CustomAsset] = None
+
+
+DEFAULT_STYLE = CardStyle()
+
+
+# Everything one card shows. image is the photo as bytes, a data: URI, a
+# file-like object or a URL to download; source is the outlet name printed
+# on the card.
+class CardSpec(NamedTuple):
+    headline: str
+    image: object = None
+    pub_date: Optional[datetime.datetime] = None
+    source: str = "Unknown"
+    language: str = "Bengali"
+    style: CardStyle = DEFAULT_STYLE
+
+
+# Functions
+def is_valid_url(url):
+    regex = re.compile(
+        r'^(https?://)'
+        r'([a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}'
+        r'(/[^?\s]*)?'
+        r'(\?[^?\s]*)?'
+        r'(\#.*)?$'
+    )
+    return re.match(regex, url) is not None
+
+def extract_main_domain(url):
+    try:
+        parsed_url = urlparse(url)
+        domain = parsed_url.netloc
+        if domain.startswith("www."):
+            domain = domain[4:]
+        # Debug: Log the extracted domain
+        # print(f"Extracted domain: {domain}")
+        return domain
+    except Exception as e:
+        # Debug: Log the exception
+        # print(f"Error extracting domain from {url}: {str(e)}")
+        return "Unknown"
+
+def map_domain_to_source(domain):
+    # The outlet's Bengali name (see publishers); unknown domains as they are.
+    publisher = publisher_registry.resolve(domain)
+    return publisher.name if publisher is not None else domain
+
+def source_label(url):
+    # The outlet as a metrics label: its mapped name, or "other" so unknown
+    # domains do not each get their own series.
+    if not url:
+        return "none"
+    publisher = publisher_registry.for_url(url)
+    return publisher.name if publisher is not None else "other"
+
+def extract_news_data(url):
+    start = time.perf_counter()
+    try:
+        article = article_cache.get(url, map_source=lambda page_url: map_domain_to_source(extract_main_domain(page_url)))
+    except Exception:
+        article_fetch_seconds.observe(time.perf_counter() - start, source_label(url), "error")
+        raise
+    article_fetch_seconds.observe(time.perf_counter() - start, source_label(url), "ok")
+    headline = article.headline if article.headline is not None else 'Headline not found'
+    source = article.site_name if article.site_name is not None else 'Source not found'
+
+    if article.image_url:
+        http_client.remember_referer(article.image_url, url)
+
+    return parse_published_time(article.published_time), headline, article.image_url, source, article.source
+
+def news_data_from_meta(url, meta):
+    # extract_news_data for an ArticleMeta fetched elsewhere, e.g. by fetch_engine.
+    headline = meta.title if meta.title is not None else 'Headline not found'
+    source = meta.site_name if meta.site_name is not None else 'Source not found'
+    return meta.published_at, headline, meta.image_url, source, map_domain_to_source(extract_main_domain(url))
+
+def download_image(image_url, max_retries=2):
+    headers = {'Accept': 'image/*'}
+    referer = http_client.referer_for(image_url)
+    for attempt in range(max_retries):
+        if attempt:
+            time.sleep(backoff(attempt - 1))
+        try:
+            with stage("download"):
+                response = http_client.get(image_url, headers=headers, referer=referer, timeout=15, allow_redirects=True)
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', '')
+                if not content_type.startswith('image/'):
+                    image_downloads.inc(source_label(image_url), "error")
+                    raise Exception("The URL does not point to a valid image file.")
+                image_downloads.inc(source_label(image_url), "ok")
+                return response.content
+        except HostUnavailable:
+            # Not retried: the breaker stays open for a while yet.
+            image_downloads.inc(source_label(image_url), "rejected")
+            raise
+        except requests.exceptions.RequestException as e:
+            if attempt < max_retries - 1 and (e.response is None or e.response.status_code in [429, 503]):
+                image_downloads.inc(source_label(image_url), "retry")
+                continue
+            image_downloads.inc(source_label(image_url), "error")
+            raise Exception(f"Failed to fetch image from URL: {str(e)}.")
+    raise Exception("Failed to fetch image after maximum retries.")
+
+def photo_bytes(image_source):
+    # URLs are downloaded first (or read from the image cache); uploads, bytes
+    # and data URIs are used as-is.
+    if isinstance(image_source, str) and not image_source.startswith("data:"):
+        data = image_cache.get_bytes(image_source)
+        if data is None:
+            data = download_image(image_source)
+            image_cache.put_bytes(image_source, data)
+        return data
+    return read_image_bytes(image_source)
+
+def crop_photos(data, sizes):
+    # {size: cover crop of the photo} for each size. Crops made before are
+    # served from the cache; the rest are cut from one master, decoded at
+    # reduced scale and resized once to cover every missing size.
+    digest = content_digest(data)
+    crops = {size: image_cache.get_crop(digest, size) for size in sizes}
+    missing = [size for size, crop in crops.items() if crop is None]
+    if not missing:
+        return crops
+
+    bounds = (max(width for width, _ in missing), max(height for _, height in missing))
+    image = ingest_image(data, cover=bounds).image
+    with stage("resize"):
+        master = image.resize(cover_size(image.size, bounds), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+        for size in missing:
+            crops[size] = resize_cover(master, size)
+
+    for size in missing:
+        image_cache.put_crop(digest, crops[size])
+    return crops
+
+def process_image(image_source, size=None):
+    # The photo cropped to size, by default DEFAULT_FORMAT's photo crop.
+    size = size or get_card_format(DEFAULT_FORMAT).photo_size
+    return crop_photos(photo_bytes(image_source), [size])[size]
+
+def fit_card_headline(headline, card_format=DEFAULT_FORMAT):
+    box = get_card_format(card_format).headline
+    return fit_headline(headline, lambda size: font_registry.get(box.role, size), box.width, box.height, box.min_size, box.max_size)
+
+def adjust_headline(headline, draw, card_format=DEFAULT_FORMAT):
+    # Fits and draws headline in card_format's headline box; returns the y
+    # below the last line.
+    plan = get_card_format(card_format)
+    return draw_headline(draw, fit_card_headline(headline, card_format), plan.headline_origin, plan.headline.width, fill="white")
+
+def convert_to_date(pub_date, language="Bengali"):
+    if language == "Bengali":
+        bengali_digits = str.maketrans("0123456789", "০১২৩৪৫৬৭৮৯")
+        bengali_months = {
+            "January": "জানুয়ারি", "February": "ফেব্রুয়ারি", "March": "মার্চ",
+            "April": "এপ্রিল", "May": "মে", "June": "জুন",
+            "July": "জুলাই", "August": "আগস্ট", "September": "সেপ্টেম্বর",
+            "October": "অক্টোবর", "November": "নভেম্বর", "December": "ডিসেম্বর"
+        }
+        date_str = pub_date.strftime("%d %B %Y") if pub_date else datetime.date.today().strftime("%d %B %Y")
+        day, month, year = date_str.split()
+        return f"{day.translate(bengali_digits)} {bengali_months.get(month, month)} {year.translate(bengali_digits)}"
+    else:
+        return pub_date.strftime("%d %B %Y") if pub_date else datetime.date.today().strftime("%d %B %Y")
+
+def load_custom_logo(source):
+    size = get_card_format(DEFAULT_FORMAT).asset_sizes["custom_logo"]
+    return asset_cache.load(source, "logo", size, lambda image: fit_within(image.convert("RGBA"), size))
+
+def load_custom_ad(source):
+    # Ads are opaque banners: any alpha is dropped.
+    size = get_card_format(DEFAULT_FORMAT).asset_sizes["custom_ad"]
+    return asset_cache.load(source, "ad", size, lambda image: image.convert("RGB").resize(size, Image.Resampling.LANCZOS))
+
+def get_card_format(name):
+    # The compiled RenderPlan of layouts/<name>.json; ValueError if none.
+    return load_plan(name)
+
+def card_headline(spec):
+    headline = spec.headline
+    if "not found" in headline.lower():
+        headline = "কোন শিরোনাম পাওয়া যায়নি" if spec.language == "Bengali" else "No Headline Found"
+    return headline.encode('utf-8').decode('utf-8')
+
+def compose_card(spec, plan, news_image=None, image_error=None, headline_layouts=None):
+    # Draws spec onto a copy of plan's template. news_image is the photo
+    # already cropped to plan.photo_size; headline_layouts maps headline boxes
+    # to fitted layouts and is shared between formats, so the headline is
+    # only fitted once per box.
+    style = spec.style
+    language = spec.language
+    with stage("template"):
+        template = template_cache.get(plan.template_key(style, language), lambda: plan.build_template(style, language))
+    canvas = template.copy()
+
+    values = {
+        "photo": news_image,
+        "photo_error": f"Image Error: {str(image_error)}" if image_error is not None else "No Image Available",
+        "source": spec.source,
+        "date": convert_to_date(spec.pub_date, language),
+    }
+    if plan.headline is not None:
+        headline_layouts = {} if headline_layouts is None else headline_layouts
+        with stage("headline"):
+            box = plan.headline
+            values["headline"] = headline_layouts.get(box)
+            if values["headline"] is None:
+                values["headline"] = headline_layouts[box] = fit_headline(
+                    card_headline(spec), lambda size: font_registry.get(box.role, size), box.width, box.height, box.min_size, box.max_size)
+    return plan.draw(canvas, style, language, values)
+
+def draw_cards(spec, formats=CARD_FORMATS):
+    # ({format name: RGB canvas} for every format in formats, photo error or
+    # None), from a single fetch and decode of the photo. Nothing is read
+    # from outside spec apart from the bundled assets (and the photo, if
+    # spec.image is a URL). A photo that cannot be loaded does not fail the
+    # cards; they show "Image Error" (or no photo, if its host is failing)
+    # and the error is returned alongside them.
+    plans = {name: get_card_format(name) for name in formats}
+    photos, image_error, photo_error = {}, None, None
+    if spec.image:
+        try:
+            photos = crop_photos(photo_bytes(spec.image), {plan.photo_size for plan in plans.values() if plan.photo_size})
+        except HostUnavailable as e:
+            photo_error = str(e)
+        except Exception as e:
+            image_error = e
+            photo_error = str(e)
+    headline_layouts = {}
+    cards = {
+        name: compose_card(spec, plan, photos.get(plan.photo_size), image_error, headline_layouts)
+        for name, plan in plans.items()
+    }
+    return cards, photo_error
+
+def draw_card(spec, card_format="feed"):
+    return draw_cards(spec, (card_format,))[0][card_format]
+
+def draw_preview(spec, scale=PREVIEW_SCALE):
+    # The full card scaled down rather than a separate small layout, so the
+    # preview has exactly the download's line breaks and font sizes.
+    card = draw_card(spec)
+    with stage("resize"):
+        return card.resize((round(card.width * scale), round(card.height * scale)), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+def render_card(spec, profile="download", **params):
+    # The encoded card; profile and params as for card_encoding.encode_image.
+    return encode_image(draw_card(spec), profile, **params)
+
+def render_cards(spec, formats=CARD_FORMATS, profile="download", **params):
+    # ({format name: encoded card}, photo error or None), all drawn by one
+    # draw_cards call.
+    cards, photo_error = draw_cards(spec, formats)
+    return {name: encode_image(card, profile, **params) for name, card in cards.items()}, photo_error
+
+def preload_fonts():
+    # Every font size the layouts use. Fonts are process-wide; only the first
+    # call in a process opens any files (and compiles the layouts).
+    sizes = {}
+    for name in CARD_FORMATS:
+        for role, role_sizes in get_card_format(name).font_sizes.items():
+            sizes.setdefault(role, set()).update(role_sizes)
+    font_registry.preload({role: sorted(role_sizes) for role, role_sizes in sizes.items()})
@@ -0,0 +1,130 @@
+import datetime
+
+from PIL import ImageColor
+
+from card_renderer import DEFAULT_STYLE, CardSpec, extract_news_data, is_valid_url, load_custom_ad, load_custom_logo, news_data_from_meta
+from image_ingest import data_uri_payload
+
+# Cards described as plain dicts: a row of a batch file or the JSON body of a
+# render request. All fields are optional, but a card needs a url, an image
+# or a headline:
+#
+#   url, headline, image, date (ISO 8601), source, language,
+#   primary_color, secondary_color, text_color, secondary_text_color,
+#   show_logo_box_overlay, logo, ad
+#
+# image is a URL, a data: URI or else read like logo and ad. How those are
+# turned into bytes is up to the caller (file paths for the batch renderer,
+# data: URIs only for the render service).
+STYLE_FIELDS = ("primary_color", "secondary_color", "text_color", "secondary_text_color")
+TEXT_FIELDS = ("url", "headline", "source", "image")
+LANGUAGES = ("Bengali", "English")
+
+
+class SpecError(ValueError):
+    pass
+
+
+def parse_flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() not in ("", "0", "false", "no", "off")
+    return bool(value)
+
+
+def parse_color(field, value):
+    # Colours are anything PIL understands: "#e41b17", "red", "rgb(...)".
+    if not isinstance(value, str):
+        raise SpecError(f"{field} must be a colour string.")
+    try:
+        ImageColor.getrgb(value)
+    except ValueError as e:
+        raise SpecError(f"Invalid {field}: {value}") from e
+    return value
+
+
+def card_style(fields, load_asset):
+    # fields as passed by check_fields.
+    style = DEFAULT_STYLE._replace(**{field: fields[field] for field in STYLE_FIELDS if fields.get(field)})
+    if "show_logo_box_overlay" in fields:
+        style = style._replace(show_logo_box_overlay=parse_flag(fields["show_logo_box_overlay"]))
+    try:
+        if fields.get("logo"):
+            style = style._replace(custom_logo=load_custom_logo(load_asset(fields["logo"])))
+        if fields.get("ad"):
+            style = style._replace(custom_ad=load_custom_ad(load_asset(fields["ad"])))
+    except (OSError, ValueError) as e:
+        raise SpecError(f"Could not read logo/ad: {e}") from e
+    return style
+
+
+def check_fields(fields):
+    # Everything about a spec that can be checked without the network or
+    # the caller's files; raises SpecError.
+    if not isinstance(fields, dict):
+        raise SpecError("A card spec must be an object.")
+    for field in TEXT_FIELDS:
+        if fields.get(field) is not None and not isinstance(fields[field], str):
+            raise SpecError(f"{field} must be a string.")
+    url = fields.get("url")
+    if url and not is_valid_url(url):
+        raise SpecError(f"Invalid URL: {url}")
+    if not (url or fields.get("image") or fields.get("headline")):
+        raise SpecError("A card needs a url, an image or a headline.")
+    image = fields.get("image")
+    if image and image.startswith("data:"):
+        try:
+            data_uri_payload(image)
+        except ValueError:
+            raise SpecError(f"Invalid image data: URI: {image[:80]}") from None
+    if fields.get("date"):
+        try:
+            datetime.datetime.fromisoformat(str(fields["date"]))
+        except ValueError as e:
+            raise SpecError(f"Invalid date: {fields['date']}") from e
+    if fields.get("language", "Bengali") not in LANGUAGES:
+        raise SpecError(f"Unsupported language: {fields['language']}")
+    for field in STYLE_FIELDS:
+        if fields.get(field):
+            parse_color(field, fields[field])
+
+
+def card_image(image, load_asset):
+    # URLs and data: URIs are passed on as they are; anything else is read
+    # through load_asset like logo and ad.
+    if is_valid_url(image) or image.startswith("data:"):
+        return image
+    try:
+        return load_asset(image)
+    except (OSError, ValueError) as e:
+        raise SpecError(f"Could not read image: {e}") from e
+
+
+def card_spec(fields, load_asset, fetched=None):
+    # fetched is the FetchedArticle for fields["url"] when the page was
+    # fetched up front (see fetch_engine); otherwise it is fetched here.
+    check_fields(fields)
+    url = fields.get("url")
+    if fetched is not None:
+        if fetched.error:
+            raise RuntimeError(f"Failed to fetch article: {fetched.error}")
+        pub_date, headline, image, _, source = news_data_from_meta(url, fetched.meta)
+        if fetched.image is not None:
+            image = fetched.image
+    elif url:
+        pub_date, headline, image, _, source = extract_news_data(url)
+    else:
+        pub_date, headline, image, source = None, "Headline not found", None, "Unknown"
+
+    if fields.get("image"):
+        image = card_image(fields["image"], load_asset)
+    if fields.get("date"):
+        pub_date = datetime.datetime.fromisoformat(str(fields["date"]))
+
+    return CardSpec(
+        headline=fields.get("headline") or headline,
+        image=image,
+        pub_date=pub_date,
+        source=fields.get("source") or source,
+        language=fields.get("language", "Bengali"),
+        style=card_style(fields, load_asset),
+    )
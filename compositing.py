@@ -0,0 +1,49 @@
+import numpy as np
+from PIL import Image, ImageColor
+
+# Whole-image compositing helpers. Everything here works on full bands or
+# NumPy arrays; nothing loops over pixels in Python.
+
+
+def scale_alpha(image, opacity):
+    # Same truncation as int(alpha * opacity) on each pixel.
+    pixels = np.array(image.convert("RGBA"))
+    pixels[..., 3] = (pixels[..., 3] * opacity).astype(np.uint8)
+    return Image.fromarray(pixels, "RGBA")
+
+
+def alpha_over(canvas, overlay, position):
+    # Blends overlay onto canvas in place using its own alpha, or copies it
+    # straight across when it has none.
+    if overlay.mode in ("RGBA", "LA"):
+        canvas.paste(overlay, position, overlay.getchannel("A"))
+    else:
+        canvas.paste(overlay, position)
+    return canvas
+
+
+def fill_color(canvas, box, color, opacity=1.0):
+    # box is a Pillow box (right/bottom exclusive).
+    rgb = ImageColor.getrgb(color)[:3] if isinstance(color, str) else tuple(color[:3])
+    if opacity >= 1.0:
+        canvas.paste(rgb + (255,) * (len(canvas.getbands()) - 3), box)
+        return canvas
+
+    region = np.asarray(canvas.crop(box), dtype=np.float32)
+    region[..., :3] = region[..., :3] * (1.0 - opacity) + np.array(rgb, dtype=np.float32) * opacity
+    canvas.paste(Image.fromarray(np.rint(region).astype(np.uint8), canvas.mode), box[:2])
+    return canvas
+
+
+def fit_within(image, max_size):
+    # Resizes so the longer side is capped by max_size, keeping the aspect
+    # ratio. Images already smaller than the box are left at their size.
+    width, height = image.size
+    aspect = width / height
+    if width > height:
+        width = min(width, max_size[0])
+        height = int(width / aspect)
+    else:
+        height = min(height, max_size[1])
+        width = int(height * aspect)
+    return image.resize((width, height), Image.Resampling.LANCZOS)
@@ -0,0 +1,43 @@
+import os
+from collections import namedtuple
+
+from image_cache import content_digest
+from image_ingest import ImageTooLargeError, ingest_image, read_image_bytes
+from lru import LRUCache
+from stage_timing import stage
+
+# Custom logos and ads are decoded and fitted to their slot on the card once,
+# when they are uploaded. A session keeps only the fitted image (at most a
+# few hundred KB) and the digest of the uploaded bytes, which is what the
+# template cache keys on. Uploads above ASSET_MAX_BYTES or ASSET_MAX_PIXELS
+# are rejected; large JPEGs are decoded at reduced scale.
+CustomAsset = namedtuple("CustomAsset", "image digest")
+
+ASSET_MAX_BYTES = int(os.environ.get("CARD_ASSET_MAX_BYTES", 16 * 1024 * 1024))
+ASSET_MAX_PIXELS = int(os.environ.get("CARD_ASSET_MAX_PIXELS", 40_000_000))
+ASSET_CACHE_SIZE = 32
+
+
+class AssetCache(LRUCache):
+    # Fitted assets by (slot, digest), so the render service and the batch
+    # renderer do not decode the same logo for every card.
+    def __init__(self, maxsize=ASSET_CACHE_SIZE):
+        super().__init__(maxsize)
+
+    def load(self, source, slot, size, fit):
+        # fit turns the decoded image into what is pasted onto the card; size
+        # is the slot's size, used to decode JPEGs at reduced scale.
+        data = read_image_bytes(source)
+        if len(data) > ASSET_MAX_BYTES:
+            raise ImageTooLargeError(f"Image is {len(data) / 1024 / 1024:.1f} MB; the limit is {ASSET_MAX_BYTES // 1024 // 1024} MB.")
+        digest = content_digest(data)
+
+        def build():
+            image = ingest_image(data, cover=size, max_pixels=ASSET_MAX_PIXELS).image
+            with stage("resize"):
+                return CustomAsset(fit(image), digest)
+
+        return self.get((slot, digest), build)
+
+
+asset_cache = AssetCache()
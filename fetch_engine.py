@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import NamedTuple, Optional
+from urllib.parse import urljoin, urlsplit
+
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.httputil import HTTPHeaders
+
+import http_client
+from article_meta import ArticleMeta, HeadMetaReader, build_article_meta, declared_charset
+from card_metrics import article_fetch_seconds, image_downloads
+from card_renderer import source_label
+from host_health import HostUnavailable, backoff, host_health, is_failure_status
+from image_cache import image_cache
+from publishers import publisher_registry
+
+# Concurrent article and photo fetching for bulk work. Many article heads are
+# streamed at once under a global and a per-host connection limit; each
+# og:image download starts as soon as its meta tag has been parsed, while the
+# rest of the head is still arriving. Finished (metadata, photo) pairs go to
+# the caller's consumers through a bounded queue, so fetching keeps at most
+# FETCH_QUEUE_SIZE results ahead of a slower (CPU-bound) rendering stage.
+# Requests go through the same per-host circuit breakers and adaptive
+# timeouts as http_client (see host_health): the "head" timeout bounds
+# connecting, and the whole request may take the "head" plus the "body" one,
+# as tornado has no per-read timeout. An image whose headers arrived but whose
+# body then timed out fails, but does not count against its host.
+FETCH_CONCURRENCY = int(os.environ.get("CARD_FETCH_CONCURRENCY", 32))
+FETCH_PER_HOST = int(os.environ.get("CARD_FETCH_PER_HOST", http_client.POOL_CONNECTIONS_PER_HOST))
+FETCH_QUEUE_SIZE = int(os.environ.get("CARD_FETCH_QUEUE_SIZE", 16))
+IMAGE_RETRIES = 2
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+# tornado handles gzip and connections itself.
+FETCH_HEADERS = {name: value for name, value in http_client.DEFAULT_HEADERS.items() if name in ("User-Agent", "Accept-Language")}
+
+
+class FetchedArticle(NamedTuple):
+    url: str
+    meta: Optional[ArticleMeta]
+    image: Optional[bytes]
+    error: Optional[str]
+    image_error: Optional[str]
+    stages_ms: dict
+
+
+class _HeadComplete(Exception):
+    # Raised from the streaming callback to drop the connection once the
+    # head has been parsed.
+    pass
+
+
+class _HeadCompleteFilter(logging.Filter):
+    # tornado logs exceptions from streaming callbacks as uncaught; the
+    # deliberate early stop is not an error.
+    def filter(self, record):
+        error = record.exc_info[1] if record.exc_info else None
+        while error is not None:
+            if isinstance(error, _HeadComplete):
+                return False
+            error = error.__context__
+        return True
+
+
+logging.getLogger("tornado.application").addFilter(_HeadCompleteFilter())
+
+
+class _HeadStream:
+    # Response state of one request (one redirect hop) of FetchEngine.fetch,
+    # fed by tornado's header and streaming callbacks.
+    def __init__(self, engine, url, fetch_image):
+        self.engine = engine
+        self.url = url
+        self.fetch_image = fetch_image
+        self.rules = publisher_registry.rules_for(url)
+        self.status = None
+        self.headers = HTTPHeaders()
+        self.reader = None
+        self.image_task = None
+
+    @property
+    def done(self):
+        return self.reader is not None and self.reader.done
+
+    def on_header(self, line):
+        if self.status is None:
+            self.status = int(line.split(" ", 2)[1])
+        elif line.strip():
+            self.headers.parse_line(line)
+
+    def on_chunk(self, chunk):
+        if self.status is None or self.status >= 300:
+            return
+        if self.reader is None:
+            self.reader = HeadMetaReader(declared_charset(self.headers.get("Content-Type", "")), self.rules)
+        done = self.reader.feed(chunk)
+        # Waits for the preferred image tag unless the head has ended.
+        image_url = self.rules.image_url(self.reader.meta, self.url) if done or self.rules.image[0] in self.reader.meta else None
+        if self.fetch_image and self.image_task is None and image_url:
+            http_client.remember_referer(image_url, self.url)
+            self.image_task = asyncio.ensure_future(self.engine.download_image(image_url))
+        if done:
+            raise _HeadComplete()
+
+    def cancel(self):
+        if self.image_task is not None:
+            self.image_task.cancel()
+
+
+class _Timing:
+    # Filled in by FetchEngine._request as a response arrives.
+    def __init__(self):
+        self.start = None
+        self.headers_at = None
+        self.status = None
+
+    def on_header(self, line):
+        # The last response's, when tornado follows redirects.
+        if line.startswith("HTTP/"):
+            self.status = int(line.split(" ", 2)[1])
+        elif not line.strip():
+            self.headers_at = time.perf_counter()
+
+    @property
+    def head_seconds(self):
+        return self.headers_at - self.start if self.headers_at is not None else None
+
+
+def _host(url):
+    host = urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+class FetchEngine:
+    # Use as `async with FetchEngine() as engine:` inside a running loop.
+    def __init__(self, concurrency=FETCH_CONCURRENCY, per_host=FETCH_PER_HOST, queue_size=FETCH_QUEUE_SIZE, timeout=10, image_timeout=15):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.image_timeout = image_timeout
+        self._client = None
+
+    async def __aenter__(self):
+        self._client = AsyncHTTPClient(force_instance=True, max_clients=self.concurrency)
+        self._connections = asyncio.Semaphore(self.concurrency)
+        self._hosts = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        return self
+
+    async def __aexit__(self, *exc):
+        self._client.close()
+        self._client = None
+
+    async def _request(self, url, headers, timeout, timing, follow_redirects=True, header_callback=None, **kwargs):
+        # Raises HostUnavailable while host's breaker is open; callers record
+        # the outcome, since only they know when a dropped stream is success.
+        # timing (a _Timing) gets the status and when the headers arrived,
+        # measured from when a connection slot was free.
+        # Streamed requests must not let tornado follow redirects: a callback
+        # that raises to stop early leaves a followed fetch hanging.
+        host = _host(url)
+        host_health.check(host)
+        head_timeout = host_health.timeout(host, timeout, "head")
+        total_timeout = min(timeout, head_timeout + host_health.timeout(host, timeout, "body"))
+
+        def on_header(line):
+            timing.on_header(line)
+            if header_callback is not None:
+                header_callback(line)
+
+        url, headers = http_client.route(url, headers)
+        request = HTTPRequest(
+            url, headers=headers, connect_timeout=head_timeout, request_timeout=total_timeout, follow_redirects=follow_redirects,
+            decompress_response=True, header_callback=on_header, **kwargs,
+        )
+        async with self._connections, self._hosts[host]:
+            timing.start = time.perf_counter()
+            return await self._client.fetch(request, raise_error=False)
+
+    async def fetch(self, url, fetch_image=True):
+        # Never raises: failures are reported in the result's error fields.
+        # Redirects are followed here, one request per hop, so each hop is
+        # streamed, rate-limited and health-checked under its own host.
+        stages = {}
+        start = time.perf_counter()
+        page_url = url
+        for _ in range(MAX_REDIRECTS + 1):
+            head = _HeadStream(self, page_url, fetch_image)
+            timing = _Timing()
+            try:
+                response = await self._request(page_url, dict(FETCH_HEADERS), self.timeout, timing, follow_redirects=False, header_callback=head.on_header, streaming_callback=head.on_chunk)
+                location = head.headers.get("Location")
+                if response.code in REDIRECT_CODES and location:
+                    host_health.record(_host(page_url), True, timing.head_seconds)
+                    page_url = urljoin(page_url, location.strip())
+                    continue
+                if response.code >= 400 or (response.error and not head.done):
+                    raise response.error or Exception(f"HTTP {response.code}")
+            except Exception as e:
+                # Closing the stream after _HeadComplete surfaces as a closed
+                # connection; anything else is a real failure.
+                if not head.done:
+                    head.cancel()
+                    if not isinstance(e, HostUnavailable):
+                        host_health.record(_host(page_url), head.status is not None and not is_failure_status(head.status), timing.head_seconds, type(e).__name__)
+                    article_fetch_seconds.observe(time.perf_counter() - start, source_label(url), "error")
+                    return FetchedArticle(url, None, None, f"{type(e).__name__}: {e}", None, stages)
+            break
+        else:
+            article_fetch_seconds.observe(time.perf_counter() - start, source_label(url), "error")
+            return FetchedArticle(url, None, None, f"Too many redirects (more than {MAX_REDIRECTS})", None, stages)
+
+        # Only the head was read, so there is no body time to record.
+        host_health.record(_host(page_url), True, timing.head_seconds)
+        reader = head.reader
+        parse_seconds = reader.parse_seconds if reader else 0.0
+        stages["fetch"] = (time.perf_counter() - start - parse_seconds) * 1000
+        stages["parse"] = parse_seconds * 1000
+        article_fetch_seconds.observe(time.perf_counter() - start, source_label(url), "ok")
+        meta = build_article_meta(reader.meta if reader else {}, reader.bytes_read if reader else 0, head.headers.get("ETag"), head.headers.get("Last-Modified"), head.rules, page_url)
+
+        image, image_error = None, None
+        if head.image_task is not None:
+            image, image_error, download_ms = await head.image_task
+            stages["download"] = download_ms
+        return FetchedArticle(url, meta, image, None, image_error, stages)
+
+    async def download_image(self, image_url):
+        # Returns (bytes or None, error or None, milliseconds).
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        data = await loop.run_in_executor(None, image_cache.get_bytes, image_url)
+        if data is not None:
+            return data, None, (time.perf_counter() - start) * 1000
+
+        headers = dict(FETCH_HEADERS, Accept="image/*", Referer=http_client.referer_for(image_url))
+        host = _host(image_url)
+        error = None
+        for attempt in range(IMAGE_RETRIES):
+            if attempt:
+                await asyncio.sleep(backoff(attempt - 1))
+            timing = _Timing()
+            try:
+                response = await self._request(image_url, headers, self.image_timeout, timing)
+            except HostUnavailable as e:
+                error = str(e)
+                image_downloads.inc(source_label(image_url), "rejected")
+                break
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                host_health.record(host, False, error=type(e).__name__)
+                image_downloads.inc(source_label(image_url), "retry" if attempt < IMAGE_RETRIES - 1 else "error")
+                continue
+            # A 599 after healthy headers is a slow or cut-off body.
+            status = timing.status if response.code == 599 and timing.status is not None else response.code
+            failed = status == 599 or is_failure_status(status)
+            body_seconds = time.perf_counter() - timing.headers_at if response.code == 200 and timing.headers_at is not None else None
+            host_health.record(host, not failed, timing.head_seconds, (type(response.error).__name__ if status == 599 else f"HTTP {status}") if failed else None, body_seconds)
+            if response.code in (429, 503) and attempt < IMAGE_RETRIES - 1:
+                image_downloads.inc(source_label(image_url), "retry")
+                continue
+            if response.code != 200:
+                error = f"HTTP {response.code}" if response.code != 599 else str(response.error)
+                image_downloads.inc(source_label(image_url), "error")
+                break
+            if not response.headers.get("Content-Type", "").startswith("image/"):
+                error = "The URL does not point to a valid image file."
+                image_downloads.inc(source_label(image_url), "error")
+                break
+            image_downloads.inc(source_label(image_url), "ok")
+            data = response.body
+            await loop.run_in_executor(None, image_cache.put_bytes, image_url, data)
+            return data, None, (time.perf_counter() - start) * 1000
+        return None, error, (time.perf_counter() - start) * 1000
+
+    async def run(self, jobs, consume, consumers=1):
+        # jobs yields (key, url, fetch_image); consume(key, fetched) is
+        # awaited by `consumers` workers as results arrive, in completion order.
+        queue = asyncio.Queue(self.queue_size)
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                await consume(*item)
+
+        tasks = [asyncio.ensure_future(self._produce(jobs, queue, consumers))]
+        tasks += [asyncio.ensure_future(worker()) for _ in range(consumers)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _produce(self, jobs, queue, consumers):
+        # A job holds its slot until its result is queued, so fetching stops
+        # once the queue is full and every connection is busy.
+        slots = asyncio.Semaphore(self.concurrency + self.queue_size)
+        pending = set()
+
+        async def fetch_one(key, url, fetch_image):
+            try:
+                await queue.put((key, await self.fetch(url, fetch_image)))
+            finally:
+                slots.release()
+
+        for key, url, fetch_image in jobs:
+            await slots.acquire()
+            task = asyncio.ensure_future(fetch_one(key, url, fetch_image))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+        for _ in range(consumers):
+            await queue.put(None)
@@ -0,0 +1,82 @@
+import os
+import threading
+
+from PIL import ImageFont
+
+from text_metrics import LAYOUT_ENGINE
+
+# Fallback chains per font role. The first file that loads wins and is
+# remembered for the life of the process; if none loads, Pillow's default
+# font is used. Relative paths are tried next to this module first, where the
+# bundled fonts are, then as given (the working directory or system fonts).
+FONT_DIR = os.path.dirname(os.path.abspath(__file__))
+FONT_FALLBACKS = {
+    "bold": ["NotoSerifBengali-Bold.ttf", "Arial Unicode MS.ttf"],
+    "regular": ["NotoSerifBengali-Regular.ttf", "Arial Unicode MS.ttf"],
+}
+
+
+class FontRegistry:
+    def __init__(self, fallbacks=FONT_FALLBACKS, layout_engine=None):
+        self.fallbacks = fallbacks
+        self.layout_engine = layout_engine
+        self.hits = 0
+        self.misses = 0
+        self._paths = {}
+        self._fonts = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, role):
+        # Returns the font file used for role, or None for the default font.
+        with self._lock:
+            if role not in self._paths:
+                self._paths[role] = self._find_path(role)
+            return self._paths[role]
+
+    def _find_path(self, role):
+        for name in self.fallbacks[role]:
+            for path in (os.path.join(FONT_DIR, name), name):
+                try:
+                    ImageFont.truetype(path, 12, layout_engine=self.layout_engine)
+                except Exception:
+                    continue
+                return path
+        return None
+
+    def get(self, role, size):
+        path = self.resolve(role)
+        key = (path, size, self.layout_engine)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self.hits += 1
+                return font
+            self.misses += 1
+        font = self._load(path, size)
+        with self._lock:
+            return self._fonts.setdefault(key, font)
+
+    def _load(self, path, size):
+        if path is None:
+            return ImageFont.load_default()
+        return ImageFont.truetype(path, size, layout_engine=self.layout_engine)
+
+    def preload(self, sizes_by_role):
+        # Loads fonts ahead of the first render without touching hit/miss counts.
+        for role, sizes in sizes_by_role.items():
+            path = self.resolve(role)
+            for size in sizes:
+                key = (path, size, self.layout_engine)
+                with self._lock:
+                    if key in self._fonts:
+                        continue
+                font = self._load(path, size)
+                with self._lock:
+                    self._fonts.setdefault(key, font)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "fonts": len(self._fonts), "paths": dict(self._paths)}
+
+
+font_registry = FontRegistry(layout_engine=LAYOUT_ENGINE)
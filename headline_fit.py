@@ -0,0 +1,106 @@
+from collections import namedtuple
+
+from text_metrics import text_measurer
+
+# Headline fitting: greedy wrapping on measured word widths, and a binary
+# search over font sizes for the largest one whose wrapped block fits the box.
+LINE_SPACING = 1.2
+ELLIPSIS = "…"
+
+HeadlineLayout = namedtuple("HeadlineLayout", "font_size font lines line_widths spacing height")
+
+
+def _wrap(words, font, max_width):
+    # Returns [(line_words, width, top, bottom)], breaking before any word
+    # that would push the line past max_width. Word metrics come from the
+    # shared measurement cache, so each word is shaped once per font size
+    # however many candidate lines it lands on.
+    space = text_measurer.length(font, " ")
+    lines = []
+    current, width, top, bottom = [], 0, None, None
+    for word in words:
+        advance = text_measurer.length(font, word)
+        _, word_top, _, word_bottom = text_measurer.bbox(font, word)
+        new_width = width + space + advance if current else advance
+        if current and new_width > max_width:
+            lines.append((current, width, top, bottom))
+            current, width, top, bottom = [], 0, None, None
+            new_width = advance
+        current.append(word)
+        width = new_width
+        top = word_top if top is None else min(top, word_top)
+        bottom = word_bottom if bottom is None else max(bottom, word_bottom)
+    if current:
+        lines.append((current, width, top, bottom))
+    return lines
+
+
+def _block_height(lines, spacing):
+    return sum(bottom - top for _, _, top, bottom in lines) + (len(lines) - 1) * spacing
+
+
+def _layout_at(words, font, max_width):
+    return _wrap(words, font, max_width), int(font.size * LINE_SPACING)
+
+
+def fit_headline(headline, get_font, max_width, max_height, min_size, max_size):
+    words = headline.split() or [headline]
+
+    best = None
+    low, high = min_size, max_size
+    while low <= high:
+        size = (low + high) // 2
+        font = get_font(size)
+        lines, spacing = _layout_at(words, font, max_width)
+        height = _block_height(lines, spacing)
+        if height <= max_height and all(width <= max_width for _, width, _, _ in lines):
+            best = HeadlineLayout(size, font, [" ".join(line) for line, _, _, _ in lines], [width for _, width, _, _ in lines], spacing, height)
+            low = size + 1
+        else:
+            high = size - 1
+
+    if best is not None:
+        return best
+    return _ellipsize(words, get_font(min_size), max_width, max_height)
+
+
+def _truncate(text, font, max_width):
+    # Drops trailing words (or characters, for a single overlong word) until
+    # the text plus an ellipsis fits.
+    words = text.split()
+    while len(words) > 1 and text_measurer.length(font, " ".join(words) + ELLIPSIS) > max_width:
+        words.pop()
+    text = " ".join(words)
+    while text and text_measurer.length(font, text + ELLIPSIS) > max_width:
+        text = text[:-1]
+    return text.rstrip() + ELLIPSIS
+
+
+def _ellipsize(words, font, max_width, max_height):
+    # Smallest size still does not fit: keep as many lines as the box holds
+    # and end the last one with an ellipsis.
+    lines, spacing = _layout_at(words, font, max_width)
+    kept = []
+    for line in lines:
+        if kept and _block_height(kept + [line], spacing) > max_height:
+            break
+        kept.append(line)
+
+    texts = [" ".join(line) for line, _, _, _ in kept]
+    truncated = len(kept) < len(lines)
+    for index, (_, width, _, _) in enumerate(kept):
+        if width > max_width or (truncated and index == len(kept) - 1):
+            texts[index] = _truncate(texts[index], font, max_width)
+
+    widths = [text_measurer.length(font, text) for text in texts]
+    return HeadlineLayout(font.size, font, texts, widths, spacing, _block_height(kept, spacing))
+
+
+def draw_headline(draw, layout, origin, box_width, fill):
+    # Draws each line centred in a box_width-wide column starting at origin;
+    # returns the y just below the last line's slot.
+    x, y = origin
+    for line, width in zip(layout.lines, layout.line_widths):
+        draw.text((x + (box_width - int(width)) // 2, y), line, fill=fill, font=layout.font)
+        y += layout.spacing
+    return y
@@ -0,0 +1,190 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+import requests
+
+# Per-host health of publisher fetches, shared by every session in the
+# process. Each host has a circuit breaker: after BREAKER_FAILURES failures in
+# a row (connection errors, timeouts, 429 and 5xx answers) it opens, and
+# requests to the host fail at once with HostUnavailable for BREAKER_COOLDOWN
+# seconds. Then a single probe request is let through; its outcome closes the
+# breaker or opens it for another cooldown.
+#
+# Timeouts follow each host's observed latency, kept apart per kind of
+# measurement: "head" is the time until the response headers arrived (for
+# any request), "body" the time then spent reading a complete body (full
+# downloads only). Once LATENCY_MIN_SAMPLES of a kind have been recorded, a
+# timeout of that kind is TIMEOUT_MULTIPLIER times the host's p95, but never
+# less than TIMEOUT_MIN or more than the caller's timeout. A "head" timeout
+# bounds connecting and waiting for each read; the time for a whole request is
+# the "head" timeout plus the "body" one.
+# Retries wait a random delay of up to BACKOFF_BASE * 2**attempt seconds
+# (capped at BACKOFF_MAX), so retries from many cards do not arrive together.
+BREAKER_FAILURES = int(os.environ.get("CARD_BREAKER_FAILURES", 3))
+BREAKER_COOLDOWN = float(os.environ.get("CARD_BREAKER_COOLDOWN", 30))
+TIMEOUT_MIN = float(os.environ.get("CARD_TIMEOUT_MIN", 2))
+TIMEOUT_MULTIPLIER = 3
+LATENCY_WINDOW = 50
+LATENCY_MIN_SAMPLES = 10
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 4.0
+MAX_HOSTS = 256
+LATENCY_KINDS = ("head", "body")
+
+
+class HostUnavailable(requests.exceptions.ConnectionError):
+    # A ConnectionError, so callers that handle failed requests handle this
+    # too; nothing was sent.
+    def __init__(self, host, retry_in, last_error=None):
+        self.host = host
+        self.retry_in = retry_in
+        self.last_error = last_error
+        super().__init__(f"{host} is not responding ({last_error or 'too many failures'}); retrying in {retry_in:.0f} s")
+
+
+def is_failure_status(status):
+    return status == 429 or status >= 500
+
+
+def backoff(attempt):
+    # Seconds to wait before retry number attempt + 1 ("full jitter").
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class _Host:
+    def __init__(self):
+        self.latencies = {kind: deque(maxlen=LATENCY_WINDOW) for kind in LATENCY_KINDS}
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_at = None
+        self.last_error = None
+        self.ok = 0
+        self.failed = 0
+        self.rejected = 0
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))]
+
+
+class HostHealth:
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN, timeout_min=TIMEOUT_MIN, maxsize=MAX_HOSTS, clock=time.monotonic):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.timeout_min = timeout_min
+        self.maxsize = maxsize
+        self.clock = clock
+        # Kept apart from the per-host counts, which go when a host is evicted.
+        self.rejected = 0
+        self._hosts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, host):
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = self._hosts[host] = _Host()
+            while len(self._hosts) > self.maxsize:
+                self._hosts.popitem(last=False)
+        self._hosts.move_to_end(host)
+        return entry
+
+    def check(self, host):
+        # Call before each request: raises HostUnavailable while the breaker
+        # is open. The first call after the cooldown goes through as the
+        # probe (and so does a later one, should a probe never report back).
+        now = self.clock()
+        with self._lock:
+            entry = self._get(host)
+            if entry.opened_at is None:
+                return
+            retry_at = entry.opened_at + self.cooldown
+            if now >= retry_at and (entry.probe_at is None or now >= entry.probe_at + self.cooldown):
+                entry.probe_at = now
+                return
+            entry.rejected += 1
+            self.rejected += 1
+            error = HostUnavailable(host, max(retry_at - now, 0), entry.last_error)
+        raise error
+
+    def is_open(self, host):
+        with self._lock:
+            entry = self._hosts.get(host)
+            return entry is not None and entry.opened_at is not None
+
+    def timeout(self, host, default, kind="head"):
+        with self._lock:
+            entry = self._hosts.get(host)
+            latencies = list(entry.latencies[kind]) if entry is not None else []
+        if len(latencies) < LATENCY_MIN_SAMPLES:
+            return default
+        return min(default, max(self.timeout_min, _percentile(latencies, 0.95) * TIMEOUT_MULTIPLIER))
+
+    def record(self, host, ok, seconds=None, error=None, body_seconds=None):
+        # The outcome of one request that check() let through: seconds until
+        # its headers arrived and, for a body read to the end, the seconds
+        # that took.
+        with self._lock:
+            entry = self._get(host)
+            entry.probe_at = None
+            if ok:
+                entry.ok += 1
+                entry.consecutive_failures = 0
+                entry.opened_at = None
+                if seconds is not None:
+                    entry.latencies["head"].append(seconds)
+                if body_seconds is not None:
+                    entry.latencies["body"].append(body_seconds)
+                return
+            entry.failed += 1
+            entry.consecutive_failures += 1
+            entry.last_error = error
+            # A failed probe reopens the breaker straight away.
+            if entry.opened_at is not None or entry.consecutive_failures >= self.failures:
+                entry.opened_at = self.clock()
+
+    def snapshot(self):
+        # One dict per host, open breakers first: for /stats and the app.
+        now = self.clock()
+        rows = []
+        with self._lock:
+            for host, entry in self._hosts.items():
+                if entry.opened_at is None:
+                    state = "closed"
+                elif now >= entry.opened_at + self.cooldown:
+                    state = "half-open"
+                else:
+                    state = "open"
+                rows.append({
+                    "host": host,
+                    "state": state,
+                    "consecutive_failures": entry.consecutive_failures,
+                    "ok": entry.ok,
+                    "failed": entry.failed,
+                    "rejected": entry.rejected,
+                    "p95_ms": round(_percentile(entry.latencies["head"], 0.95) * 1000, 1) if entry.latencies["head"] else None,
+                    "body_p95_ms": round(_percentile(entry.latencies["body"], 0.95) * 1000, 1) if entry.latencies["body"] else None,
+                    "retry_in": round(max(entry.opened_at + self.cooldown - now, 0), 1) if entry.opened_at is not None else None,
+                    "last_error": entry.last_error,
+                })
+        return sorted(rows, key=lambda row: (row["state"] == "closed", -row["consecutive_failures"], row["host"]))
+
+    def clear(self):
+        with self._lock:
+            self._hosts.clear()
+            self.rejected = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hosts": len(self._hosts),
+                "open": sum(entry.opened_at is not None for entry in self._hosts.values()),
+                "rejected": self.rejected,
+                "maxsize": self.maxsize,
+            }
+
+
+host_health = HostHealth()
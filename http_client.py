@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from host_health import host_health, is_failure_status
+from publishers import publisher_registry
+
+# Shared HTTP layer for article and image fetches. One pooled keep-alive
+# session per process, so repeated cards from the same outlet reuse warm
+# connections instead of paying DNS + TCP + TLS on every request.
+POOL_HOSTS = 32
+POOL_CONNECTIONS_PER_HOST = 4
+MAX_LEARNED_REFERERS = 1024
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept-Language': 'bn,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+_session = None
+_session_lock = threading.Lock()
+_learned_referers = OrderedDict()
+_referers_lock = threading.Lock()
+_host_overrides = {}
+
+
+def _build_session():
+    session = requests.Session()
+    # pool_block caps concurrent connections per host instead of opening
+    # throwaway extra ones under load.
+    adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_CONNECTIONS_PER_HOST, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _build_session()
+        return _session
+
+
+def set_session(session):
+    # Swaps the shared session, e.g. for one with a mocked transport.
+    global _session
+    with _session_lock:
+        _session = session
+
+
+def host_of(url):
+    # The key for per-host state: lower-case hostname without www.
+    host = urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def remember_referer(image_url, page_url):
+    # Images found on an article are fetched with that article's origin as
+    # Referer, which is what publisher CDNs check for hotlinking.
+    # Bounded: the least recently used image hosts are forgotten.
+    page = urlsplit(page_url)
+    host = host_of(image_url)
+    with _referers_lock:
+        _learned_referers[host] = f"{page.scheme}://{page.netloc}"
+        _learned_referers.move_to_end(host)
+        while len(_learned_referers) > MAX_LEARNED_REFERERS:
+            _learned_referers.popitem(last=False)
+
+
+def referer_for(url):
+    # Learned referers first, then the outlet's own (for image CDNs that
+    # only serve hotlinked images with it, see publishers), then the origin.
+    host = host_of(url)
+    with _referers_lock:
+        learned = _learned_referers.get(host)
+        if learned is not None:
+            _learned_referers.move_to_end(host)
+    if learned is not None:
+        return learned
+    publisher = publisher_registry.resolve(host)
+    if publisher is not None and publisher.referer:
+        return publisher.referer
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def override_host(host, base_url):
+    # Sends every request for host to base_url instead (e.g. a local HTTP
+    # stand-in in tests and benchmarks). The original Host header is kept.
+    _host_overrides[host] = urlsplit(base_url)
+
+
+def clear_host_overrides():
+    _host_overrides.clear()
+
+
+def route(url, headers=None):
+    # The URL and headers a request for url is actually sent with.
+    parts = urlsplit(url)
+    target = _host_overrides.get(parts.hostname)
+    if target is None:
+        return url, headers
+    headers = dict(headers or {}, Host=parts.netloc)
+    return urlunsplit((target.scheme, target.netloc, parts.path, parts.query, "")), headers
+
+
+def get(url, headers=None, referer=None, timeout=None, **kwargs):
+    # Goes through the host's circuit breaker (see host_health): raises
+    # HostUnavailable at once while it is open, and timeout is the upper
+    # bound of the host's adaptive "head" timeout, which requests applies to
+    # connecting and to each read.
+    if referer:
+        headers = dict(headers or {}, Referer=referer)
+    host = host_of(url)
+    host_health.check(host)
+    if timeout is not None:
+        timeout = host_health.timeout(host, timeout)
+    url, headers = route(url, headers)
+    start = time.perf_counter()
+    try:
+        response = get_session().get(url, headers=headers, timeout=timeout, **kwargs)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        host_health.record(host, False, error=type(e).__name__)
+        raise
+    # elapsed is the time until a response's headers were parsed; without
+    # stream=True the body has been read by now as well.
+    head_seconds = sum(hop.elapsed.total_seconds() for hop in response.history + [response])
+    body_seconds = None if kwargs.get("stream") else max(time.perf_counter() - start - head_seconds, 0.0)
+    failed = is_failure_status(response.status_code)
+    host_health.record(host, not failed, response.elapsed.total_seconds(), f"HTTP {response.status_code}" if failed else None, body_seconds)
+    return response
@@ -0,0 +1,178 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from PIL import Image
+
+# On-disk cache for source photos, shared by sessions and processes.
+#
+#   urls/<sha1 of URL>           -> content hash of the bytes that URL served
+#   blobs/<content hash>         -> original encoded bytes
+#   crops/<content hash>-WxH.rgb -> decoded, cropped RGB pixels for one size
+#
+# Blobs are content-addressed, so a wire photo reused across outlets is
+# stored (and cropped) once. Every write goes through a temp file and
+# os.replace, so concurrent readers never see a partial file. Files are
+# touched on use and the least recently used are evicted once the cache
+# exceeds its byte budget, down to EVICT_TO of it. The cache's size is kept as
+# a running total, so the directories are only walked on the first write and
+# when evicting (which also picks up what other processes have written).
+#
+# A URL entry records when it was stored and is trusted for URL_TTL seconds;
+# after that the URL is downloaded again, in case the publisher has put a new
+# photo at the same address.
+IMAGE_CACHE_DIR = os.environ.get("CARD_IMAGE_CACHE_DIR", os.path.join(".cache", "images"))
+IMAGE_CACHE_BYTES = int(os.environ.get("CARD_IMAGE_CACHE_BYTES", 512 * 1024 * 1024))
+URL_TTL = float(os.environ.get("CARD_IMAGE_URL_TTL", 6 * 3600))
+EVICT_TO = 0.9
+
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ImageCache:
+    def __init__(self, directory=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_BYTES, url_ttl=URL_TTL):
+        self.max_bytes = max_bytes
+        self.url_ttl = url_ttl
+        self.hits = 0
+        self.misses = 0
+        self.crop_hits = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        self.directory = directory
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @directory.setter
+    def directory(self, directory):
+        self._directory = directory
+        # Bytes on disk; None until the directory has been walked.
+        self._total = None
+
+    def _path(self, kind, name):
+        return os.path.join(self.directory, kind, name)
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _write(self, path, data):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except OSError:
+            # A full or read-only disk only costs us the cache.
+            return
+        with self._lock:
+            if self._total is not None:
+                self._total += len(data) - replaced
+            over = self._total is None or self._total > self.max_bytes
+        if over:
+            self._evict()
+
+    def _url_path(self, url):
+        return self._path("urls", hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+    def _digest_for(self, url):
+        # "<digest> <stored at>"; entries past their TTL (or in an older
+        # format) count as missing.
+        entry = self._read(self._url_path(url))
+        try:
+            digest, stored_at = entry.decode("ascii").split()
+            if time.time() - float(stored_at) <= self.url_ttl:
+                return digest
+        except (AttributeError, UnicodeDecodeError, ValueError):
+            pass
+        return None
+
+    def get_bytes(self, url):
+        digest = self._digest_for(url)
+        data = self._read(self._path("blobs", digest)) if digest else None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.bytes_saved += len(data)
+        return data
+
+    def put_bytes(self, url, data):
+        digest = content_digest(data)
+        blob_path = self._path("blobs", digest)
+        if not os.path.exists(blob_path):
+            self._write(blob_path, data)
+        self._write(self._url_path(url), f"{digest} {time.time():.0f}".encode("ascii"))
+        return digest
+
+    def get_crop(self, digest, size):
+        data = self._read(self._path("crops", f"{digest}-{size[0]}x{size[1]}.rgb"))
+        if data is None or len(data) != size[0] * size[1] * 3:
+            return None
+        with self._lock:
+            self.crop_hits += 1
+        return Image.frombytes("RGB", size, data)
+
+    def put_crop(self, digest, image):
+        image = image.convert("RGB")
+        self._write(self._path("crops", f"{digest}-{image.width}x{image.height}.rgb"), image.tobytes())
+
+    def _evict(self):
+        files = []
+        total = 0
+        for kind in ("urls", "blobs", "crops"):
+            try:
+                entries = list(os.scandir(os.path.join(self.directory, kind)))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total > self.max_bytes:
+            target = self.max_bytes * EVICT_TO
+            for _, size, path in sorted(files):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= target:
+                    break
+        with self._lock:
+            self._total = total
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "crop_hits": self.crop_hits,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+image_cache = ImageCache()
@@ -0,0 +1,78 @@
+import base64
+import os
+from collections import namedtuple
+from io import BytesIO
+
+from PIL import Image
+
+from stage_timing import stage
+
+# One way in for every source image: raw bytes, a file-like object, a
+# Streamlit upload or a data: URI. The encoded bytes are decoded exactly once
+# and kept alongside the image so callers can cache or re-serve them as-is.
+IngestedImage = namedtuple("IngestedImage", "image data format")
+
+# Large photos are decoded with cost proportional to the output size: images
+# above MAX_IMAGE_PIXELS are rejected before any pixels are decoded, JPEGs are
+# decoded at the smallest DCT scale (1/2, 1/4 or 1/8) that still covers the
+# requested size, and resizing first shrinks by an integer factor with
+# reduce() whenever the source is at least REDUCING_GAP times the target.
+MAX_IMAGE_PIXELS = int(os.environ.get("CARD_MAX_IMAGE_PIXELS", 80_000_000))
+REDUCING_GAP = 3.0
+
+
+class ImageTooLargeError(ValueError):
+    pass
+
+
+def data_uri_payload(source):
+    # The base64 part of a data: URI; ValueError if source is not one.
+    header, separator, payload = source.partition(",")
+    if not header.startswith("data:") or not separator:
+        raise ValueError("Expected image bytes or a data: URI.")
+    return payload
+
+
+def read_image_bytes(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, str):
+        return base64.b64decode(data_uri_payload(source))
+    if hasattr(source, "getvalue"):
+        # BytesIO and Streamlit's UploadedFile: no need to rewind.
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+
+def cover_size(size, target_size):
+    # Smallest size with the source's aspect ratio that covers target_size.
+    width, height = size
+    target_width, target_height = target_size
+    aspect_ratio = width / height
+    if aspect_ratio > target_width / target_height:
+        return int(target_height * aspect_ratio), target_height
+    return target_width, int(target_width / aspect_ratio)
+
+
+def ingest_image(source, cover=None, max_pixels=MAX_IMAGE_PIXELS):
+    # cover is the size the image will be cropped to afterwards; JPEGs are
+    # then decoded at reduced scale.
+    data = read_image_bytes(source)
+    with stage("decode"):
+        image = Image.open(BytesIO(data))
+        if max_pixels and image.width * image.height > max_pixels:
+            raise ImageTooLargeError(f"Image is {image.width}x{image.height}; the limit is {max_pixels // 1_000_000} megapixels.")
+        if cover and image.format == "JPEG":
+            image.draft(image.mode, cover_size(image.size, cover))
+        image.load()
+    return IngestedImage(image, data, image.format)
+
+
+def resize_cover(image, target_size, reducing_gap=REDUCING_GAP):
+    # Scales to cover target_size and crops the centre.
+    new_width, new_height = cover_size(image.size, target_size)
+    image = image.resize((new_width, new_height), Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+    left = (new_width - target_size[0]) // 2
+    top = (new_height - target_size[1]) // 2
+    return image.crop((left, top, left + target_size[0], top + target_size[1]))
@@ -0,0 +1,45 @@
+import threading
+
+import cachetools
+
+# The bounded, process-wide caches (templates, text metrics, custom assets)
+# are all this: a least-recently-used map behind a lock, with hit and miss
+# counts for stats() and the metrics.
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.hits = 0
+        self.misses = 0
+        self._entries = cachetools.LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self):
+        return self._entries.maxsize
+
+    def get(self, key, build):
+        # The cached value for key, or build()'s result, which is then cached.
+        # build runs outside the lock, so a slow one does not hold up other
+        # lookups; two threads missing the same key may both build it.
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = build()
+        with self._lock:
+            self._entries[key] = value
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
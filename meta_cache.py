@@ -0,0 +1,188 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from article_meta import fetch_article_meta
+from host_health import HostUnavailable
+
+# Process-wide cache of article metadata, shared by every Streamlit session.
+# Fresh entries are served without touching the network; expired ones are
+# revalidated with If-None-Match / If-Modified-Since when the publisher sent
+# validators, and only re-parsed if the page actually changed. While the
+# publisher's circuit breaker is open (see host_health), an expired entry is
+# served as it is rather than failing the card.
+#
+# With CARD_META_CACHE_PATH set, entries are also kept in a JSON file, written
+# at most every META_CACHE_SAVE_INTERVAL seconds and at exit. A file from a
+# build with a different META_CACHE_VERSION is ignored, as are rows that do
+# not fit CachedArticle.
+META_CACHE_TTL = float(os.environ.get("CARD_META_CACHE_TTL", 600))
+META_CACHE_SIZE = int(os.environ.get("CARD_META_CACHE_SIZE", 512))
+META_CACHE_PATH = os.environ.get("CARD_META_CACHE_PATH") or None
+META_CACHE_SAVE_INTERVAL = float(os.environ.get("CARD_META_CACHE_SAVE_INTERVAL", 30))
+META_CACHE_VERSION = 1
+
+TRACKING_PARAMS = {"fbclid", "gclid", "_ga", "ref"}
+
+
+class CachedArticle(NamedTuple):
+    headline: Optional[str]
+    image_url: Optional[str]
+    published_time: Optional[str]
+    site_name: Optional[str]
+    source: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    expires_at: float
+
+
+def _entry_from_row(row):
+    # A CachedArticle from a saved [key, fields] row, or None if it is malformed.
+    try:
+        key, fields = row
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(key, str) or not isinstance(fields, list) or len(fields) != len(CachedArticle._fields):
+        return None
+    entry = CachedArticle(*fields)
+    optional = (entry.headline, entry.image_url, entry.published_time, entry.site_name, entry.etag, entry.last_modified)
+    if not isinstance(entry.source, str) or not all(value is None or isinstance(value, str) for value in optional):
+        return None
+    if isinstance(entry.expires_at, bool) or not isinstance(entry.expires_at, (int, float)):
+        return None
+    return entry
+
+
+def normalize_url(url):
+    # Same article, same key: lower-case host without www., no fragment, no
+    # tracking parameters, remaining query parameters sorted.
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port:
+        host = f"{host}:{parts.port}"
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if not key.startswith("utm_") and key not in TRACKING_PARAMS)
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), host, path, urlencode(query), ""))
+
+
+class ArticleMetaCache:
+    def __init__(self, ttl=META_CACHE_TTL, maxsize=META_CACHE_SIZE, path=META_CACHE_PATH, save_interval=META_CACHE_SAVE_INTERVAL):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.path = path
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stale = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.time()
+        if path:
+            self._load()
+            atexit.register(self.flush)
+
+    def get(self, url, map_source):
+        # map_source(url) gives the Bengali source name stored with the entry.
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        try:
+            if entry is not None and (entry.etag or entry.last_modified):
+                meta = fetch_article_meta(url, etag=entry.etag, last_modified=entry.last_modified)
+                if meta is None:
+                    with self._lock:
+                        self.revalidated += 1
+                    return self._store(key, entry._replace(expires_at=time.time() + self.ttl))
+            else:
+                meta = fetch_article_meta(url)
+        except HostUnavailable:
+            if entry is None:
+                raise
+            with self._lock:
+                self.stale += 1
+            return entry
+
+        with self._lock:
+            self.misses += 1
+        return self._store(key, CachedArticle(
+            headline=meta.title,
+            image_url=meta.image_url,
+            published_time=meta.published_time,
+            site_name=meta.site_name,
+            source=map_source(url),
+            etag=meta.etag,
+            last_modified=meta.last_modified,
+            expires_at=time.time() + self.ttl,
+        ))
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            due = time.time() - self._saved_at >= self.save_interval
+        if self.path and due:
+            self.flush()
+        return entry
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != META_CACHE_VERSION or not isinstance(data.get("entries"), list):
+            return
+        # Rows are saved least recently used first.
+        for row in data["entries"][-self.maxsize:] if self.maxsize > 0 else []:
+            entry = _entry_from_row(row)
+            if entry is not None:
+                self._entries[row[0]] = entry
+
+    def flush(self):
+        # Writes the entries to path if anything changed since the last write.
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            rows = [[key, list(entry)] for key, entry in self._entries.items()]
+            self._dirty = False
+            self._saved_at = time.time()
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": META_CACHE_VERSION, "entries": rows}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # Persistence is best effort; the in-memory cache still works.
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.revalidated = self.stale = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "revalidated": self.revalidated, "stale": self.stale, "size": len(self._entries), "maxsize": self.maxsize}
+
+
+article_cache = ArticleMetaCache()
@@ -0,0 +1,146 @@
+import datetime
+import re
+from typing import NamedTuple, Optional
+from urllib.parse import urljoin, urlsplit
+
+# Outlets the cards know by name, and how to read their article pages. A host
+# resolves to the entry with the longest matching domain suffix, so
+# m.prothomalo.com and en.prothomalo.com are প্রথম আলো too; lookups walk a
+# trie of domain labels, one dict step per label. Adding an outlet is an
+# entry here. Entries only list what differs from the generic og: rules:
+#
+#   title, image, site_name, published   <meta> tags to read (property= or
+#                                        name=), most preferred first
+#   date_format     strptime format for published times that are not ISO 8601
+#   image_rewrites  [(regex, replacement)] applied to the image URL
+#   referer         Referer sent for the outlet's images, for CDNs that check it
+#   image_domains   the outlet's image CDNs; they resolve to the outlet too
+PUBLISHERS = [
+    {"name": "বিডিনিউজ২৪", "domains": ["bdnews24.com"]},
+    {"name": "বাংলা ট্রিবিউন", "domains": ["banglatribune.com"]},
+    {"name": "প্রথম আলো", "domains": ["prothomalo.com"]},
+    {"name": "কালের কণ্ঠ", "domains": ["kalerkantho.com"]},
+    {"name": "ইত্তেফাক", "domains": ["ittefaq.com.bd"], "image_domains": ["ittefaqbd.com"], "referer": "https://www.ittefaq.com.bd"},
+    {"name": "সমকাল", "domains": ["samakal.com"]},
+    {"name": "জনকণ্ঠ", "domains": ["dailyjanakantha.com"]},
+    {"name": "যুগান্তর", "domains": ["jugantor.com"]},
+    {"name": "মানবজমিন", "domains": ["mzamin.com"]},
+    {"name": "দি ডেইলি স্টার", "domains": ["thedailystar.net"]},
+    {"name": "দি বিজনেস স্ট্যান্ডার্ড", "domains": ["tbsnews.net"]},
+    {"name": "বিবিসি বাংলা", "domains": ["bbc.com"]},
+    {"name": "কালবেলা", "domains": ["kalbela.com"]},
+    {"name": "আজকের পত্রিকা", "domains": ["ajkerpatrika.com"]},
+    {"name": "ঢাকা পোস্ট", "domains": ["dhakapost.com"]},
+    {"name": "দৈনিক পূর্বকোণ", "domains": ["dainikpurbokone.net"]},
+    {"name": "দৈনিক আজাদী", "domains": ["dainikazadi.net"]},
+    {"name": "চট্টগ্রাম প্রতিদিন", "domains": ["ctgpratidin.com"]},
+    {"name": "একাত্তর টিভি", "domains": ["ekattor.tv"]},
+    {"name": "যমুনা টিভি", "domains": ["jamuna.tv"]},
+    {"name": "ডিবিসি নিউজ", "domains": ["dbcnews.tv"]},
+    {"name": "আর টিভি", "domains": ["rtvonline.com"]},
+    {"name": "এন টিভি", "domains": ["ntvbd.com"]},
+]
+
+
+def pick(meta, keys):
+    return next((meta[key] for key in keys if key in meta), None)
+
+
+class ExtractionRules(NamedTuple):
+    title: tuple = ("og:title",)
+    image: tuple = ("og:image",)
+    site_name: tuple = ("og:site_name",)
+    published: tuple = ("article:published_time",)
+    date_format: Optional[str] = None
+    image_rewrites: tuple = ()
+    # Every tag above: what the head parser keeps.
+    properties: frozenset = frozenset()
+
+    def complete(self, meta):
+        # Parsing can stop once each field's preferred tag has been seen.
+        return all(keys[0] in meta for keys in (self.title, self.image, self.site_name, self.published))
+
+    def image_url(self, meta, page_url=None):
+        url = pick(meta, self.image)
+        if not url:
+            return None
+        # og:image is sometimes relative or protocol-relative.
+        url = urljoin(page_url, url.strip()) if page_url else url.strip()
+        for pattern, replacement in self.image_rewrites:
+            url = pattern.sub(replacement, url)
+        return url
+
+    def published_at(self, value):
+        if not value:
+            return None
+        if self.date_format:
+            try:
+                return datetime.datetime.strptime(value.strip(), self.date_format)
+            except ValueError:
+                pass
+        try:
+            return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+
+
+def compile_rules(entry):
+    fields = {name: tuple(entry[name]) for name in ("title", "image", "site_name", "published") if name in entry}
+    rules = ExtractionRules(
+        date_format=entry.get("date_format"),
+        image_rewrites=tuple((re.compile(pattern), replacement) for pattern, replacement in entry.get("image_rewrites", ())),
+        **fields,
+    )
+    return rules._replace(properties=frozenset(rules.title + rules.image + rules.site_name + rules.published))
+
+
+GENERIC_RULES = compile_rules({})
+
+
+class Publisher(NamedTuple):
+    name: str
+    domains: tuple
+    rules: ExtractionRules = GENERIC_RULES
+    referer: Optional[str] = None
+
+
+class PublisherRegistry:
+    def __init__(self, entries=PUBLISHERS):
+        # Trie over reversed domain labels ("com" -> "prothomalo" -> ...);
+        # the None key of a node holds the publisher owning that domain.
+        self._trie = {}
+        self.publishers = []
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        domains = tuple(entry["domains"]) + tuple(entry.get("image_domains", ()))
+        publisher = Publisher(entry["name"], domains, compile_rules(entry), entry.get("referer"))
+        for domain in domains:
+            node = self._trie
+            for label in reversed(domain.lower().split(".")):
+                node = node.setdefault(label, {})
+            node[None] = publisher
+        self.publishers.append(publisher)
+        return publisher
+
+    def resolve(self, host):
+        # The publisher of the longest registered suffix of host, or None.
+        found = None
+        node = self._trie
+        for label in reversed((host or "").lower().rstrip(".").split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+    def for_url(self, url):
+        return self.resolve(urlsplit(url).hostname) if url else None
+
+    def rules_for(self, url):
+        publisher = self.for_url(url)
+        return publisher.rules if publisher is not None else GENERIC_RULES
+
+
+publisher_registry = PublisherRegistry()
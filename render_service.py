@@ -0,0 +1,245 @@
+"""Local HTTP service that renders photo cards on request.
+
+    POST /render   JSON card spec (see card_spec) -> the encoded card
+    GET  /stats    JSON counters and per-host circuit breaker states
+    GET  /metrics  Prometheus metrics (see card_metrics)
+
+/render?profile=NAME picks a card_encoding profile or use case (default:
+download, i.e. PNG); &quality=N overrides JPEG/WebP quality. The response is
+the raw image with the profile's Content-Type.
+
+Article pages and photo URLs are fetched on the event loop (see fetch_engine);
+rendering runs in a pool of worker processes. At most --max-pending requests
+are admitted at once, counting ones still being fetched or waiting for a
+worker; beyond that the service answers 503 with Retry-After straight away.
+A request that is not done within --timeout seconds gets 504. Logos and ads
+are passed as data: URIs. Errors are JSON: {"error": "..."}. Renders are
+profiled in the workers as configured by CARD_PROFILE* (see card_profiler).
+
+    python -m render_service [--port 8510] [--workers N] [--max-pending N] [--timeout S]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import tornado.web
+
+import http_client
+from card_encoding import get_profile
+from card_metrics import observe_card, registry
+from card_profiler import profile_card
+from card_renderer import preload_fonts, render_card, source_label
+from card_spec import SpecError, card_spec
+from fetch_engine import FetchEngine
+from host_health import host_health
+from image_ingest import read_image_bytes
+from stage_timing import trace_card
+
+MAX_BODY_BYTES = 20 * 1024 * 1024
+
+
+class ArticleFetchError(Exception):
+    pass
+
+
+def render_in_worker(spec, profile, params):
+    # Runs in a worker process: the encoded card plus per-stage milliseconds.
+    with trace_card() as trace, profile_card("service"):
+        data = render_card(spec, profile, **params)
+    return data, trace.as_dict()
+
+
+def load_asset(value):
+    # Only inline images: a service must not read paths from its own disk.
+    if not isinstance(value, str) or not value.startswith("data:"):
+        raise ValueError("logo, ad and image files must be sent as data: URIs")
+    return read_image_bytes(value)
+
+
+class RenderService:
+    def __init__(self, pool, engine, max_pending, timeout):
+        self.pool = pool
+        self.engine = engine
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.counts = {"rendered": 0, "rejected": 0, "timed_out": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def admit(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.counts["rejected"] += 1
+                return False
+            self.pending += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.pending -= 1
+
+    def count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts, pending=self.pending, max_pending=self.max_pending)
+        return dict(counts, hosts=host_health.snapshot())
+
+    async def render(self, fields, profile, params, deadline):
+        # Called with an admitted slot; returns (image bytes, stages_ms). The slot is
+        # handed over to the pool job, so a render that outlives its request
+        # still counts as pending until its worker is actually free again.
+        loop = asyncio.get_running_loop()
+        submitted = False
+        try:
+            stages = {}
+            fetched = None
+            url = fields.get("url") if isinstance(fields, dict) else None
+            # A url that is not a string is rejected by card_spec.
+            if url and isinstance(url, str):
+                fetched = await asyncio.wait_for(self.engine.fetch(url, fetch_image=not fields.get("image")), deadline - loop.time())
+                stages.update(fetched.stages_ms)
+                if fetched.error:
+                    raise ArticleFetchError(fetched.error)
+            # Off the loop: logo and ad data: URIs are decoded and fitted here.
+            spec = await asyncio.wait_for(loop.run_in_executor(None, card_spec, fields, load_asset, fetched), deadline - loop.time())
+            if isinstance(spec.image, str) and not spec.image.startswith("data:"):
+                image, _, download_ms = await asyncio.wait_for(self.engine.download_image(spec.image), deadline - loop.time())
+                stages["download"] = download_ms
+                if image is not None:
+                    spec = spec._replace(image=image)
+                elif host_health.is_open(http_client.host_of(spec.image)):
+                    # Fail fast to "No Image Available" instead of the
+                    # worker trying the failing host again.
+                    spec = spec._replace(image=None)
+
+            job = self.pool.submit(render_in_worker, spec, profile, params)
+            submitted = True
+            job.add_done_callback(lambda _: loop.call_soon_threadsafe(self.release))
+            data, render_stages = await asyncio.wait_for(asyncio.wrap_future(job), deadline - loop.time())
+        finally:
+            if not submitted:
+                self.release()
+        stages.update(render_stages)
+        return data, stages
+
+
+class RenderHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+
+    def fail(self, status, message):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps({"error": message}))
+
+    async def post(self):
+        service = self.service
+        try:
+            fields = json.loads(self.request.body)
+        except ValueError as e:
+            return self.fail(400, f"Invalid JSON: {e}")
+        profile = self.get_argument("profile", "download")
+        params = {}
+        try:
+            encode_profile = get_profile(profile)
+        except ValueError as e:
+            return self.fail(400, str(e))
+        quality = self.get_argument("quality", None)
+        if quality is not None:
+            if not quality.isdigit() or not 1 <= int(quality) <= 100:
+                return self.fail(400, "quality must be an integer from 1 to 100.")
+            params["quality"] = int(quality)
+        url = fields.get("url") if isinstance(fields, dict) else None
+        source = source_label(url if isinstance(url, str) else None)
+        if not service.admit():
+            observe_card("service", source, "rejected")
+            self.set_header("Retry-After", "1")
+            return self.fail(503, "Render queue is full.")
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + service.timeout
+        try:
+            data, stages = await service.render(fields, profile, params, deadline)
+        except SpecError as e:
+            observe_card("service", source, "invalid", total_ms=(loop.time() - start) * 1000)
+            return self.fail(400, str(e))
+        except ArticleFetchError as e:
+            service.count("failed")
+            observe_card("service", source, "fetch_error", total_ms=(loop.time() - start) * 1000)
+            return self.fail(502, f"Failed to fetch article: {e}")
+        except asyncio.TimeoutError:
+            service.count("timed_out")
+            observe_card("service", source, "timeout", total_ms=(loop.time() - start) * 1000)
+            return self.fail(504, f"Rendering took longer than {service.timeout:g} s.")
+        except Exception as e:
+            service.count("failed")
+            observe_card("service", source, "error", total_ms=(loop.time() - start) * 1000)
+            return self.fail(500, f"{type(e).__name__}: {e}")
+
+        service.count("rendered")
+        observe_card("service", source, "ok", stages, (loop.time() - start) * 1000, data, encode_profile.format.lower())
+        self.set_header("Content-Type", encode_profile.mime)
+        self.set_header("Server-Timing", ", ".join(f"{name};dur={ms:.1f}" for name, ms in stages.items()))
+        self.finish(data)
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+
+    def get(self):
+        self.finish(self.service.stats())
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(registry.render())
+
+
+def make_app(service):
+    return tornado.web.Application([
+        (r"/render", RenderHandler, {"service": service}),
+        (r"/stats", StatsHandler, {"service": service}),
+        (r"/metrics", MetricsHandler),
+    ])
+
+
+async def serve(args):
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=preload_fonts) as pool:
+        async with FetchEngine() as engine:
+            service = RenderService(pool, engine, args.max_pending, args.timeout)
+            server = make_app(service).listen(args.port, address=args.host, max_body_size=MAX_BODY_BYTES)
+            print(f"Rendering cards on http://{args.host}:{args.port}/render with {args.workers} workers")
+            try:
+                await asyncio.Event().wait()
+            finally:
+                server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8510)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="render processes (default: one per core)")
+    parser.add_argument("--max-pending", type=int, default=None, help="requests admitted at once (default: 4 per worker)")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds per request, fetching included")
+    args = parser.parse_args(argv)
+    if args.max_pending is None:
+        args.max_pending = 4 * args.workers
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Per-stage wall-clock timing for one card generation. Stages are recorded
+# into whichever trace is active in the current thread/context; with no
+# active trace, stage() is a no-op apart from one ContextVar lookup.
+CARD_STAGES = ["fetch", "parse", "download", "decode", "resize", "template", "headline", "encode"]
+
+_current_trace = ContextVar("card_stage_trace", default=None)
+_last_trace = None
+_last_trace_lock = threading.Lock()
+
+
+class StageTrace:
+    def __init__(self, on_stage=None):
+        self.on_stage = on_stage
+        self.stages = []
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, name, seconds):
+        self.stages.append((name, seconds))
+        if self.on_stage:
+            self.on_stage(self, name)
+
+    def completed(self):
+        return {name for name, _ in self.stages}
+
+    def as_dict(self):
+        # Milliseconds per stage in pipeline order; repeated stages are summed.
+        totals = {}
+        for name, seconds in self.stages:
+            totals[name] = totals.get(name, 0.0) + seconds * 1000
+        return totals
+
+    def total_ms(self):
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return (end - self.started) * 1000
+
+
+@contextmanager
+def trace_card(on_stage=None):
+    global _last_trace
+    trace = StageTrace(on_stage)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.finished = time.perf_counter()
+        _current_trace.reset(token)
+        with _last_trace_lock:
+            _last_trace = trace
+
+
+@contextmanager
+def stage(name):
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.record(name, time.perf_counter() - start)
+
+
+def record_stage(name, seconds):
+    # For stages measured by hand, e.g. interleaved with another stage.
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(name, seconds)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def last_trace():
+    # The most recently finished trace in this process.
+    with _last_trace_lock:
+        return _last_trace
@@ -0,0 +1,16 @@
+from lru import LRUCache
+
+# Process-wide cache of composited card backgrounds. Lives in its own module
+# because Streamlit re-executes app.py on every rerun, while imported modules
+# (and their state) are shared by every session in the process.
+TEMPLATE_CACHE_SIZE = 16
+
+
+class TemplateCache(LRUCache):
+    # get() returns the shared template; callers must copy() before drawing
+    # on it.
+    def __init__(self, maxsize=TEMPLATE_CACHE_SIZE):
+        super().__init__(maxsize)
+
+
+template_cache = TemplateCache()
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+import http_client
+from fetch_engine import MAX_REDIRECTS, FetchEngine
+from host_health import host_health
+from http_standin import Route, StandinServer
+
+TITLE = "শিরোনাম"
+
+
+def long_head_page():
+    # The meta tags come first and the head then runs on for ~200 KB, so the
+    # engine stops reading long before the page ends.
+    head = f'<html><head><meta charset="utf-8"><meta property="og:title" content="{TITLE}"><meta property="og:site_name" content="Outlet">'
+    return (head + "<script>" + "var x = 1;" * 20000 + "</script></head><body></body></html>").encode("utf-8")
+
+
+@pytest.fixture
+def server():
+    routes = {"/news": Route(long_head_page())}
+    with StandinServer(routes) as server:
+        http_client.override_host("news.example", server.base_url)
+        host_health.clear()
+        yield server
+        http_client.clear_host_overrides()
+        host_health.clear()
+
+
+def redirect_chain(server, hops, target="/news"):
+    # /r<hops> -> /r<hops - 1> -> ... -> /r1 -> target, mixing redirect codes.
+    for hop in range(1, hops + 1):
+        location = target if hop == 1 else f"/r{hop - 1}"
+        server.routes[f"/r{hop}"] = Route(b"", status=(301, 302, 307)[hop % 3], headers={"Location": location})
+    return f"https://news.example/r{hops}"
+
+
+def fetch(url, timeout=10):
+    async def run():
+        async with FetchEngine(timeout=5) as engine:
+            return await asyncio.wait_for(engine.fetch(url, fetch_image=False), timeout)
+
+    return asyncio.run(run())
+
+
+def test_redirect_chain_into_long_head(server):
+    fetched = fetch(redirect_chain(server, 3))
+    assert fetched.error is None
+    assert fetched.meta.title == TITLE
+    assert [path for _, path in server.requests] == ["/r3", "/r2", "/r1", "/news"]
+
+
+def test_redirect_to_another_host(server):
+    server.routes["/moved"] = Route(b"", status=301, headers={"Location": "https://www.news.example/news"})
+    http_client.override_host("www.news.example", server.base_url)
+    fetched = fetch("https://news.example/moved")
+    assert fetched.error is None
+    assert fetched.meta.title == TITLE
+    assert server.requests == [("news.example", "/moved"), ("www.news.example", "/news")]
+
+
+def test_too_many_redirects(server):
+    fetched = fetch(redirect_chain(server, MAX_REDIRECTS + 1))
+    assert fetched.meta is None
+    assert "Too many redirects" in fetched.error
+    assert len(server.requests) == MAX_REDIRECTS + 1
@@ -0,0 +1,120 @@
+import pytest
+
+import http_client
+from host_health import HostHealth, HostUnavailable, host_health
+from http_standin import Route, StandinServer
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def health(clock):
+    return HostHealth(failures=3, cooldown=30, timeout_min=1, clock=clock)
+
+
+def state(health, host):
+    return next(row["state"] for row in health.snapshot() if row["host"] == host)
+
+
+def open_breaker(health, host):
+    for _ in range(health.failures):
+        health.check(host)
+        health.record(host, False, error="HTTP 503")
+
+
+def test_opens_after_consecutive_failures(health):
+    for _ in range(health.failures - 1):
+        health.check("a.example")
+        health.record("a.example", False, error="HTTP 503")
+    assert state(health, "a.example") == "closed"
+    health.check("a.example")
+    health.record("a.example", False, error="HTTP 503")
+    assert state(health, "a.example") == "open"
+
+
+def test_success_resets_the_failure_count(health):
+    for ok in (False, False, True, False, False):
+        health.check("a.example")
+        health.record("a.example", ok)
+    assert state(health, "a.example") == "closed"
+
+
+def test_open_breaker_rejects_requests(health, clock):
+    open_breaker(health, "a.example")
+    clock.now += 10
+    with pytest.raises(HostUnavailable) as raised:
+        health.check("a.example")
+    assert raised.value.host == "a.example"
+    assert raised.value.retry_in == pytest.approx(20)
+    assert raised.value.last_error == "HTTP 503"
+    assert health.stats()["rejected"] == 1
+    # Other hosts are not affected.
+    health.check("b.example")
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success(health, clock):
+    open_breaker(health, "a.example")
+    clock.now += 30
+    assert state(health, "a.example") == "half-open"
+    health.check("a.example")
+    with pytest.raises(HostUnavailable):
+        health.check("a.example")
+    health.record("a.example", True, 0.1)
+    assert state(health, "a.example") == "closed"
+    health.check("a.example")
+
+
+def test_failed_probe_reopens_for_another_cooldown(health, clock):
+    open_breaker(health, "a.example")
+    clock.now += 30
+    health.check("a.example")
+    health.record("a.example", False, error="ConnectTimeout")
+    assert state(health, "a.example") == "open"
+    clock.now += 29
+    with pytest.raises(HostUnavailable):
+        health.check("a.example")
+    clock.now += 1
+    health.check("a.example")
+
+
+def test_probe_that_never_reports_is_replaced_after_a_cooldown(health, clock):
+    open_breaker(health, "a.example")
+    clock.now += 30
+    health.check("a.example")
+    clock.now += 30
+    health.check("a.example")
+
+
+def test_timeouts_follow_each_kind_separately(health):
+    for _ in range(10):
+        health.record("a.example", True, 0.2, body_seconds=3.0)
+    assert health.timeout("a.example", 10, "head") == pytest.approx(1.0)
+    assert health.timeout("a.example", 10, "body") == pytest.approx(9.0)
+    assert health.timeout("a.example", 5, "body") == 5
+    assert health.timeout("b.example", 10) == 10
+
+
+def test_http_client_goes_through_the_breaker():
+    with StandinServer({"/down": Route(b"", status=503)}) as server:
+        http_client.override_host("down.example", server.base_url)
+        host_health.clear()
+        try:
+            for _ in range(host_health.failures):
+                assert http_client.get("https://down.example/down", timeout=5).status_code == 503
+            with pytest.raises(HostUnavailable):
+                http_client.get("https://down.example/down", timeout=5)
+            assert len(server.requests) == host_health.failures
+        finally:
+            http_client.clear_host_overrides()
+            host_health.clear()
@@ -0,0 +1,54 @@
+import os
+
+from PIL import ImageFont, features
+
+from lru import LRUCache
+
+# Shaped-text measurement shared by every text-drawing site. With libraqm
+# each getbbox/getlength call re-shapes the whole string, so results are
+# cached per (font, text).
+TEXT_METRICS_CACHE_SIZE = 4096
+
+
+def select_layout_engine(name=None):
+    # "raqm" or "basic" forces an engine; otherwise raqm is used when Pillow
+    # was built with it, since Bengali conjuncts need complex shaping.
+    if name == "basic":
+        return ImageFont.Layout.BASIC
+    if name == "raqm" or features.check("raqm"):
+        return ImageFont.Layout.RAQM
+    return ImageFont.Layout.BASIC
+
+
+LAYOUT_ENGINE = select_layout_engine(os.environ.get("CARD_LAYOUT_ENGINE"))
+
+
+def _font_key(font):
+    # Fonts come from the font registry and live for the whole process, so the
+    # object identity is a safe stand-in for fonts not loaded from a path.
+    path = getattr(font, "path", None)
+    if not isinstance(path, str):
+        path = id(font)
+    return path, getattr(font, "size", None), getattr(font, "layout_engine", None)
+
+
+class TextMeasurer(LRUCache):
+    def __init__(self, maxsize=TEXT_METRICS_CACHE_SIZE):
+        super().__init__(maxsize)
+
+    def _lookup(self, kind, font, text, measure):
+        return self.get((kind, _font_key(font), text), lambda: measure(text))
+
+    def bbox(self, font, text):
+        # Same box as draw.textbbox((0, 0), text, font=font).
+        return self._lookup("bbox", font, text, font.getbbox)
+
+    def length(self, font, text):
+        return self._lookup("length", font, text, font.getlength)
+
+    def width(self, font, text):
+        bbox = self.bbox(font, text)
+        return bbox[2] - bbox[0]
+
+
+text_measurer = TextMeasurer()